@@ -0,0 +1,336 @@
+"""Gemini analysis: prompt construction and the model call.
+
+``google.genai`` and the Pydantic models in ``schema.py`` are imported only
+when ``analyze_pdf`` runs, so workers and tests that just need the prompt or
+the schema do not pay for the HTTP/protobuf stack at import time.
+"""
+from __future__ import annotations
+
+import json
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from hedging import HedgePolicy, hedged_call
+from schema_artifact import load_json_schema
+from tracing import span, traced
+
+if TYPE_CHECKING:
+    from cascade import Cascade
+    from schema import CASPArticleEvaluation
+
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+MODEL_NAME = "gemini-2.5-flash"
+
+
+# ---------------------------------------------------------------------------
+# Prompt
+# ---------------------------------------------------------------------------
+SYSTEM_PROMPT = """\
+You are a SENIOR SCIENTIFIC RESEARCHER with expertise in systematic critical appraisal.
+You MUST produce a single JSON object that strictly conforms to the provided JSON schema.
+
+═══════════════════════════════════════════════════════════════════════════
+MULTI-FRAMEWORK SCIENTIFIC ANALYSIS SYSTEM
+═══════════════════════════════════════════════════════════════════════════
+
+STEP 0: CLASSIFY THE STUDY TYPE
+────────────────────────────────
+First, determine the study_type:
+• ORIGINAL_ARTICLE: Primary research (RCT, cohort, case-control, cross-sectional, etc.)
+• SYSTEMATIC_REVIEW: Systematic search + quality appraisal + synthesis
+• NARRATIVE_REVIEW: Literature overview without systematic methodology
+• META_ANALYSIS: Quantitative synthesis of multiple studies
+
+FRAMEWORK SELECTION BY STUDY TYPE
+──────────────────────────────────
+
+IF ORIGINAL_ARTICLE:
+  frameworks_applied = ["CASP", "GRADE", "PICO"]
+  • CASP: Assess methodology quality (validity, bias, reporting)
+  • GRADE: Assess certainty of evidence (risk of bias, inconsistency, imprecision, indirectness)
+  • PICO: Define clinical question structure
+
+IF SYSTEMATIC_REVIEW:
+  frameworks_applied = ["AMSTAR_2", "PRISMA", "GRADE", "CASP"]
+  • AMSTAR 2: Critical appraisal of systematic review process (16 items)
+  • PRISMA: Reporting transparency (27-item checklist)
+  • GRADE: Quality of the body of evidence synthesized
+  • CASP: Use CASP Systematic Review checklist (adapt questions)
+  
+  IMPORTANT for Systematic Reviews:
+  • Effect size (Q7): Answer can be "VARIES" or "PARTIAL" if studies show heterogeneous results
+  • Precision (Q8): Answer can be "VARIES" or "PARTIAL" if confidence intervals differ across studies
+  • For Q7 and Q8, describe the RANGE of effect sizes/precision across included studies
+  • Example Q7 answer: "VARIES - effect sizes range from small (d=0.2) to large (d=0.8)"
+  • Example Q8 answer: "PARTIAL - some studies report narrow CIs, others report wide CIs or only p-values"
+
+IF NARRATIVE_REVIEW:
+  frameworks_applied = ["SANRA", "PICO_SCOPE"]
+  • SANRA: Scale for Assessment of Narrative Review Articles (6 dimensions)
+  • PICO_SCOPE: Define the scope and breadth of the review
+
+═══════════════════════════════════════════════════════════════════════════
+CASP EVALUATION (FOR ORIGINAL ARTICLES)
+═══════════════════════════════════════════════════════════════════════════
+
+CASP Question texts (use these EXACT strings):
+────────────────────────────────────────────────
+  Q1  "Did the trial address a clearly focused issue?"
+  Q2  "Was the assignment of patients to treatments randomised?"
+  Q3  "Were all patients who entered the trial properly accounted for at its conclusion?"
+  Q4  "Were patients, health workers and study personnel blind to treatment?"
+  Q5  "Were the groups similar at the start of the trial?"
+  Q6  "Aside from the experimental intervention, were the groups treated equally?"
+  Q7  "How large was the treatment effect?"
+  Q8  "How precise was the estimate of the treatment effect?"
+  Q9  "Can the results be applied in your context?"
+  Q10 "Were all clinically important outcomes considered?"
+  Q11 "Are the benefits worth the harms and costs?"
+
+Scoring (0.0 to 1.0 per question):
+  • 1.0 = Fully met with clear evidence
+  • 0.5 = Partially met or unclear
+  • 0.0 = Not met or serious concerns
+
+Answer types for Q1-Q11:
+  • "YES", "NO", "PARTIAL", "NOT_APPLICABLE", "UNCLEAR"
+  • For Q7 (effect size): Can also use "LARGE", "MODERATE", "SMALL", "NONE", "VARIES"
+  • For Q8 (precision): Can also use "HIGH", "MODERATE", "LOW", "VARIES"
+  • For systematic reviews: "VARIES" indicates heterogeneity across included studies
+  • For systematic reviews: "PARTIAL" indicates some studies meet criteria, others don't
+
+═══════════════════════════════════════════════════════════════════════════
+GRADE CERTAINTY OF EVIDENCE
+═══════════════════════════════════════════════════════════════════════════
+
+Start at HIGH and downgrade for:
+  • Risk of Bias: Lack of blinding, allocation concealment issues
+  • Inconsistency: Unexplained heterogeneity across studies
+  • Indirectness: Population/intervention differs from target
+  • Imprecision: Wide confidence intervals, small sample size
+  • Publication Bias: Funnel plot asymmetry, industry funding
+
+CRITICAL RULE: Small sample sizes (N < 10 humans) → Downgrade GRADE by 2 levels
+
+Final GRADE levels:
+  • HIGH: Very confident in effect estimate
+  • MODERATE: Moderately confident; true effect likely close to estimate
+  • LOW: Limited confidence; true effect may differ substantially
+  • VERY_LOW: Very little confidence in effect estimate
+
+═══════════════════════════════════════════════════════════════════════════
+CROSS-MODEL VALIDATION & CONFLICTS
+═══════════════════════════════════════════════════════════════════════════
+
+MANDATORY: Check for conflicts between frameworks
+  • If CASP score ≥ 80% but GRADE is LOW/VERY_LOW:
+      → Final quality_rating MUST be LOW or MODERATE at best
+      → Document in cross_model_conflicts field
+  
+  • If GRADE is HIGH but CASP has serious validity concerns (Q2, Q4, Q5 < 0.5):
+      → Final quality_rating MUST be MODERATE at best
+      → Document in cross_model_conflicts field
+
+Example conflict:
+  "High CASP methodology score (72%) conflicts with Low GRADE certainty due to 
+   very small human sample (N=7), lack of blinding, and short intervention period. 
+   GRADE certainty takes precedence for final rating."
+
+═══════════════════════════════════════════════════════════════════════════
+CRITICAL APPRAISAL: WHAT WAS NOT CONSIDERED?
+═══════════════════════════════════════════════════════════════════════════
+
+For EVERY study, populate what_was_not_considered with:
+  ✓ Missing long-term outcomes (if study duration < 6 months for chronic conditions)
+  ✓ Safety in vulnerable subgroups (elderly, children, pregnant women)
+  ✓ Implementation barriers (cost, accessibility, training requirements)
+  ✓ Patient-reported outcomes if only biomarkers measured
+  ✓ Quality of life measures
+  ✓ Adverse events in specific populations
+  ✓ Generalizability beyond study setting
+
+═══════════════════════════════════════════════════════════════════════════
+SCIENTIFIC JUSTIFICATION (REQUIRED)
+═══════════════════════════════════════════════════════════════════════════
+
+In the scientific_justification field, explain:
+  1. Which frameworks were applied and why
+  2. How each framework influenced the final quality_rating
+  3. Any conflicts between frameworks and how they were resolved
+  4. Why the final percentage_score and quality_rating are appropriate
+
+Example:
+  "This original article was evaluated using CASP (methodology), GRADE (certainty), 
+   and PICO (clinical structure). CASP yielded 65% (moderate methodology) due to 
+   lack of blinding and unclear randomization. However, GRADE assessment revealed 
+   very serious imprecision (N=7 humans, 7-day intervention) and high risk of bias, 
+   downgrading certainty to LOW. The final quality_rating of MODERATE reflects the 
+   compromise: acceptable animal model methodology but insufficient human evidence. 
+   Percentage score adjusted to 59% to account for GRADE concerns taking precedence 
+   over CASP methodology scoring."
+
+═══════════════════════════════════════════════════════════════════════════
+SCORING CALCULATION (DETERMINISTIC)
+═══════════════════════════════════════════════════════════════════════════
+
+STEP 1: Calculate raw CASP score
+  • Sum scores Q1-Q11 (treat Q11 "N/A" as 0, exclude from denominator)
+  • total_score = sum of all scores
+  • total_applicable_questions = 11 (or 10 if Q11 is N/A)
+
+STEP 2: Calculate preliminary percentage
+  • preliminary_percentage = (total_score / total_applicable_questions) × 100
+
+STEP 3: Apply GRADE adjustment
+  • If GRADE is VERY_LOW: reduce by 15-25 points
+  • If GRADE is LOW: reduce by 10-15 points
+  • If GRADE is MODERATE: reduce by 0-5 points
+  • If GRADE is HIGH: no reduction
+
+STEP 4: Final percentage_score and quality_rating
+  • percentage_score = preliminary_percentage - GRADE_adjustment
+  • Clamp to [0, 100]
+  • quality_rating thresholds:
+      LOW: < 40
+      MODERATE: 40-64
+      MODERATE_TO_HIGH: 65-79
+      HIGH: ≥ 80
+
+═══════════════════════════════════════════════════════════════════════════
+FIELD GUIDANCE
+═══════════════════════════════════════════════════════════════════════════
+
+• study_type: Use StudyType enum (ORIGINAL_ARTICLE, SYSTEMATIC_REVIEW, etc.)
+• frameworks_applied: List of strings matching study type
+• what_was_not_considered: Always provide 3-7 items (never empty!)
+• scientific_justification: Always provide (200+ words explaining framework integration)
+• cross_model_conflicts: Provide if CASP vs GRADE conflict exists, else null
+• evaluation_date: Today's date in ISO format (YYYY-MM-DD)
+• limitations_found: Use empty list [] only if genuinely no limitations
+• For animal studies: Fill animal-specific fields; for human-only: use "NOT_APPLICABLE"
+• Tables in the article text appear as [TABLE pN.M] … [/TABLE] blocks of tab-separated
+  rows (first row = header); read effect sizes, CIs and p-values for Q7/Q8 from them
+• Return ONLY the JSON – no markdown fences, no commentary
+
+Be CRITICAL, be DECISIVE, be CONSISTENT.
+"""
+
+
+# ---------------------------------------------------------------------------
+# Prompt and model call (shared with reevaluation.py and jobqueue.py)
+# ---------------------------------------------------------------------------
+@lru_cache(maxsize=1)
+def _json_schema_text() -> str:
+    return json.dumps(load_json_schema(), indent=2)
+
+
+def get_json_schema() -> str:
+    """Return the JSON schema string, preferring the precomputed artifact."""
+    # The span sits outside the cache so every traced document shows the stage.
+    with span("schema.json_schema") as current:
+        current.set("cached", _json_schema_text.cache_info().currsize > 0)
+        return _json_schema_text()
+
+
+def build_prompt(text: str) -> str:
+    """Return the full evaluation prompt for the extracted article *text*."""
+    return (
+        f"{SYSTEM_PROMPT}\n\n"
+        "Analyze the following scientific article and produce the CASP / GRADE / PICO "
+        "evaluation as a single JSON object.\n\n"
+        "Your response MUST conform EXACTLY to this JSON Schema:\n"
+        f"```\n{get_json_schema()}\n```\n\n"
+        f"--- BEGIN ARTICLE TEXT ---\n{text}\n--- END ARTICLE TEXT ---"
+    )
+
+
+def generation_config():
+    """Return the ``GenerateContentConfig`` used for every evaluation call."""
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        responseMimeType="application/json",
+        # responseSchema removed - too complex for Gemini's constraints
+        # Schema is embedded in prompt and validated via Pydantic after
+        temperature=0.0,  # Maximum determinism for consistent evaluations
+        topP=1.0,         # Use all tokens (no randomness)
+    )
+
+
+def parse_evaluation(response_text: str) -> CASPArticleEvaluation:
+    """Parse and validate a raw model response; raises on invalid output."""
+    from schema import CASPArticleEvaluation
+
+    if not response_text:
+        # No candidates or a safety block: the SDK's response.text is None.
+        raise ValueError("empty model response")
+    raw_json = json.loads(response_text)
+    return CASPArticleEvaluation(**raw_json)
+
+
+def call_model(
+    client,
+    model: str,
+    prompt: str,
+    config,
+    hedge: Optional[HedgePolicy],
+    parse: Callable[[str], Any] = parse_evaluation,
+):
+    """Run one (optionally hedged) model call; return (parse(text), usage metadata)."""
+
+    def parse_response(response):
+        with span("analyze_pdf.validate"):
+            return parse(response.text), response.usage_metadata
+
+    if hedge is None:
+        with span("analyze_pdf.generate", model=model):
+            response = client.models.generate_content(model=model, contents=prompt, config=config)
+        return parse_response(response)
+
+    async def request():
+        with span("analyze_pdf.generate", model=model, hedged=True):
+            return await client.aio.models.generate_content(
+                model=model, contents=prompt, config=config
+            )
+
+    import asyncio
+
+    return asyncio.run(hedged_call(request, parse_response, hedge))
+
+
+@traced("analyze_pdf")
+def analyze_pdf(
+    text: str,
+    api_key: str,
+    hedge: Optional[HedgePolicy] = None,
+    cascade: Optional[Cascade] = None,
+) -> CASPArticleEvaluation:
+    """Send extracted text to Gemini Flash and return a validated evaluation.
+
+    If *hedge* is given, each model call is hedged: a duplicate request is
+    sent when the first one is slower than the policy's latency percentile,
+    and the first response that validates wins (see ``hedging.py``).
+
+    If *cascade* is given, its tiers are tried from the cheapest model up
+    instead of always calling ``MODEL_NAME`` (see ``cascade.py``). Hedging is
+    then configured per tier (``Tier.hedge``), not with *hedge*.
+    """
+    if cascade is not None and hedge is not None:
+        raise ValueError("with a cascade, give each Tier its own hedge policy")
+    with span("analyze_pdf.client"):
+        from google import genai
+
+        client = genai.Client(api_key=api_key)
+        config = generation_config()
+    with span("analyze_pdf.build_prompt"):
+        prompt = build_prompt(text)
+
+    if cascade is None:
+        evaluation, _usage = call_model(client, MODEL_NAME, prompt, config, hedge)
+        return evaluation
+    return cascade.run(
+        text, lambda model, tier_hedge: call_model(client, model, prompt, config, tier_hedge)
+    )
@@ -0,0 +1,90 @@
+"""Benchmark the model cascade against a local stub.
+
+The stub answers the fast tier with a mix of good, internally inconsistent
+and invalid evaluations, and the strong tier always correctly. Documents
+are a mix of short RCT reports (some citing earlier meta-analyses) and
+reviews/long texts. The script reports
+per-tier metrics and documents per dollar for the single-model baseline
+versus the cascade, using the prices below (USD per 1M input tokens,
+~4 characters per token; output cost is ignored as it is similar).
+
+Usage::
+
+    python bench_cascade.py --docs 200 --bad-rate 0.2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from stub_gemini import StubGemini, sample_evaluation
+
+PRICE_PER_M_INPUT = {"gemini-2.5-flash-lite": 0.10, "gemini-2.5-flash": 0.30}
+LATENCY_S = {"gemini-2.5-flash-lite": 0.05, "gemini-2.5-flash": 0.2}
+
+
+def _documents(count: int, complex_rate: float, rng: random.Random) -> list[str]:
+    simple = "Randomised controlled trial of drug versus placebo. " * 300
+    # RCT introductions often cite earlier syntheses; these must stay on the fast tier.
+    citing = (
+        "Drug versus placebo for hypertension: a randomised controlled trial\n"
+        "Background: Previous meta-analyses suggested a benefit, and a systematic review "
+        "called for larger trials. "
+    ) + simple
+    review = "A systematic review and meta-analysis of 40 trials. " * 600
+    return [
+        review if rng.random() < complex_rate else rng.choice([simple, citing])
+        for _ in range(count)
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--complex-rate", type=float, default=0.2)
+    parser.add_argument("--bad-rate", type=float, default=0.2,
+                        help="share of fast-tier answers that are invalid or inconsistent")
+    args = parser.parse_args()
+
+    from analysis import analyze_pdf
+    from cascade import Cascade
+
+    rng = random.Random(0)
+    good = json.dumps(sample_evaluation())
+    inconsistent = json.dumps(sample_evaluation(percentage_score=95.0))
+
+    def respond(request: dict) -> str:
+        if request["model"].endswith("lite") and rng.random() < args.bad_rate:
+            return rng.choice(['{"truncated": ', inconsistent])
+        return good
+
+    docs = _documents(args.docs, args.complex_rate, rng)
+    cascade = Cascade()
+    results = {}
+    with StubGemini(latency=lambda r: LATENCY_S[r["model"]], respond=respond) as stub:
+        os.environ["GOOGLE_GEMINI_BASE_URL"] = stub.url
+        for label, mode in (("baseline", None), ("cascade", cascade)):
+            first = len(stub.requests)
+            started = time.monotonic()
+            for text in docs:
+                analyze_pdf(text, api_key="stub", cascade=mode)
+            elapsed = time.monotonic() - started
+            dollars = sum(
+                len(json.dumps(r["body"])) / 4 / 1e6 * PRICE_PER_M_INPUT[r["model"]]
+                for r in stub.requests[first:]
+            )
+            results[label] = (elapsed, dollars)
+
+    for tier in cascade.stats():
+        print(json.dumps(tier))
+    for label, (elapsed, dollars) in results.items():
+        print(f"{label:<9} {elapsed:6.2f} s  ${dollars:.4f}  {args.docs / dollars:10.0f} docs/$")
+    base, casc = results["baseline"][1], results["cascade"][1]
+    print(f"throughput per dollar: x{base / casc:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Benchmark hedged model calls against a local stub with latency outliers.
+
+Runs the same batch through ``analyze_pdf`` twice, without and with a
+``HedgePolicy``, against ``stub_gemini.StubGemini`` and reports p50/p99
+latency, batch makespan and hedge counters.
+
+Usage::
+
+    python bench_hedging.py --calls 400 --outlier-rate 0.05
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stub_gemini import StubGemini, outlier_latency
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def run_batch(calls: int, workers: int, hedge) -> tuple[list[float], float]:
+    from analysis import analyze_pdf
+
+    def one(_i: int) -> float:
+        started = time.monotonic()
+        analyze_pdf("stub article text", api_key="stub", hedge=hedge)
+        return time.monotonic() - started
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(one, range(calls)))
+    return latencies, time.monotonic() - started
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--median", type=float, default=0.05, help="typical latency (s)")
+    parser.add_argument("--outlier", type=float, default=1.0, help="outlier latency (s)")
+    parser.add_argument("--outlier-rate", type=float, default=0.05)
+    parser.add_argument("--percentile", type=float, default=90.0)
+    parser.add_argument("--max-hedge-rate", type=float, default=0.15)
+    args = parser.parse_args()
+
+    from hedging import HedgePolicy
+
+    policy = HedgePolicy(
+        percentile=args.percentile, min_samples=20, max_hedge_rate=args.max_hedge_rate
+    )
+    results = {}
+    for label, hedge in (("baseline", None), ("hedged", policy)):
+        latency = outlier_latency(args.median, args.outlier, args.outlier_rate, seed=0)
+        with StubGemini(latency=latency) as stub:
+            os.environ["GOOGLE_GEMINI_BASE_URL"] = stub.url
+            latencies, makespan = run_batch(args.calls, args.workers, hedge)
+            results[label] = (latencies, makespan, len(stub.requests))
+
+    for label, (latencies, makespan, requests) in results.items():
+        print(
+            f"{label:<9} p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+            f"p99 {_percentile(latencies, 99) * 1000:7.1f} ms  "
+            f"makespan {makespan:6.2f} s  requests {requests}"
+        )
+    print(f"hedge stats: {policy.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
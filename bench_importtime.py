@@ -0,0 +1,85 @@
+"""Import-time benchmark with budgets that CI can enforce.
+
+Each module is imported in a fresh interpreter under ``python -X importtime``;
+the cumulative time reported for the module itself is compared against its
+budget, and the run fails if any module pulls in a heavy dependency that
+should only load when its code path runs.
+
+Usage::
+
+    python bench_importtime.py            # report, exit 1 on any violation
+    python bench_importtime.py --runs 5   # take the best of 5 runs
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+# Module -> cumulative import budget in milliseconds.
+BUDGETS_MS = {
+    "schema_artifact": 30,
+    "extraction": 30,
+    "triage": 30,
+    "analysis": 50,
+    "scoring": 10,
+    "cascade": 20,
+    "reevaluation": 50,
+    "jobqueue": 50,
+    "app": 60,
+}
+
+# Dependencies none of the modules above may import eagerly.
+FORBIDDEN = ("streamlit", "pdfplumber", "pdfminer", "PIL", "google.genai", "pydantic")
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure(module: str) -> tuple[float, set[str]]:
+    """Import *module* in a fresh interpreter; return (ms, imported names)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total_us = 0
+    imported: set[str] = set()
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        imported.add(name)
+        if name == module and len(indent) == 1:
+            total_us = cumulative
+    return total_us / 1000, imported
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="best-of-N runs per module")
+    args = parser.parse_args()
+
+    failures: list[str] = []
+    for module, budget in BUDGETS_MS.items():
+        results = [measure(module) for _ in range(args.runs)]
+        best_ms = min(ms for ms, _ in results)
+        leaked = sorted(
+            name
+            for name in results[0][1]
+            if any(name == dep or name.startswith(dep + ".") for dep in FORBIDDEN)
+        )
+        status = "ok" if best_ms <= budget and not leaked else "FAIL"
+        print(f"{module:<16} {best_ms:8.1f} ms  (budget {budget} ms)  {status}")
+        if best_ms > budget:
+            failures.append(f"{module}: {best_ms:.1f} ms exceeds {budget} ms")
+        if leaked:
+            failures.append(f"{module}: eagerly imports {', '.join(leaked[:5])}")
+
+    for failure in failures:
+        print(f"  - {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""Model cascade: try a cheap model first, escalate only when needed.
+
+Most uploads are short, simple RCT reports that a fast model appraises
+correctly. A ``Cascade`` runs its tiers in order and accepts the first
+result that
+
+* validates against ``CASPArticleEvaluation``, and
+* passes the internal-consistency checks in ``scoring.py``.
+
+A tier is skipped up front when the document is larger than its
+``max_chars`` or, for ``skip_if_complex`` tiers, when the title or abstract
+states a review or meta-analysis design. A ``skip_if_complex`` tier's result
+is also escalated when it classifies the study as a systematic review or
+meta-analysis. The last tier's valid result is always accepted.
+Every tier keeps its own counters (see ``Cascade.stats``) and, when hedged,
+its own ``HedgePolicy``: tiers differ in latency, so a shared histogram
+would hedge the slower tier against the faster one's percentile.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Callable, Optional, Sequence, Tuple
+
+from scoring import consistency_issues
+
+if TYPE_CHECKING:
+    from hedging import HedgePolicy
+    from schema import CASPArticleEvaluation
+
+
+# Documents longer than this (in characters) are treated as complex.
+COMPLEX_CHARS = 60_000
+
+# Statements of an evidence-synthesis design, matched in the title and
+# abstract. Bare mentions ("previous meta-analyses suggested...") are common
+# in RCT introductions and deliberately do not match.
+_COMPLEX_MARKERS = re.compile(
+    r"\bPRISMA\b"
+    r"|\b(we|authors?)\s+(conducted|performed|undertook|carried\s+out|report)\s+an?\s+"
+    r"(updated\s+)?(systematic\s+review|meta[- ]analysis|network\s+meta)"
+    r"|\bthis\s+(systematic\s+review|meta[- ]analysis|umbrella\s+review)"
+    r"|\A\W*(an?\s+)?(systematic\s+review|(network\s+)?meta[- ]analysis|umbrella\s+review)\b"
+    r"|:\s*an?\s+(updated\s+)?(systematic\s+review|(network\s+)?meta[- ]analysis)"
+    r"|\bincluded\s+(studies|trials|RCTs)\b"
+    r"|\b(searched|search\s+of)\s+(MEDLINE|PubMed|Embase|CENTRAL|the\s+Cochrane)",
+    re.IGNORECASE,
+)
+_MARKER_WINDOW = 4_000
+
+# study_type values for which a fast tier's answer is escalated.
+_COMPLEX_STUDY_TYPES = ("SYSTEMATIC_REVIEW", "META_ANALYSIS")
+
+
+def is_complex(text: str) -> bool:
+    """Heuristic: long documents and self-declared evidence syntheses are complex."""
+    return len(text) > COMPLEX_CHARS or bool(_COMPLEX_MARKERS.search(text[:_MARKER_WINDOW]))
+
+
+class Tier:
+    """One model in the cascade.
+
+    Args:
+        model: Gemini model name.
+        max_chars: Skip this tier for documents longer than this.
+        skip_if_complex: Skip this tier when ``is_complex(text)``.
+        hedge: Hedge this tier's calls with this policy; do not share one
+            policy between tiers.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_chars: Optional[int] = None,
+        skip_if_complex: bool = False,
+        hedge: Optional[HedgePolicy] = None,
+    ):
+        self.model = model
+        self.max_chars = max_chars
+        self.skip_if_complex = skip_if_complex
+        self.hedge = hedge
+        self.attempts = 0
+        self.accepted = 0
+        self.seconds = 0.0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.skipped: Counter = Counter()
+        self.escalated: Counter = Counter()
+
+    def skip_reason(self, text: str) -> Optional[str]:
+        if self.max_chars is not None and len(text) > self.max_chars:
+            return "size"
+        if self.skip_if_complex and is_complex(text):
+            return "complexity"
+        return None
+
+    def stats(self) -> dict:
+        stats = {
+            "model": self.model,
+            "attempts": self.attempts,
+            "accepted": self.accepted,
+            "seconds": round(self.seconds, 3),
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "skipped": dict(self.skipped),
+            "escalated": dict(self.escalated),
+        }
+        if self.hedge is not None:
+            stats["hedge"] = self.hedge.stats()
+        return stats
+
+
+# (evaluation, usage metadata or None) for a model name and its hedge policy.
+ModelCall = Callable[[str, Optional["HedgePolicy"]], Tuple["CASPArticleEvaluation", Any]]
+
+
+class Cascade:
+    """Ordered tiers plus shared, thread-safe per-tier metrics."""
+
+    def __init__(self, tiers: Optional[Sequence[Tier]] = None, check_consistency: bool = True):
+        if tiers is None:
+            from analysis import MODEL_NAME
+
+            tiers = (
+                Tier("gemini-2.5-flash-lite", max_chars=COMPLEX_CHARS, skip_if_complex=True),
+                Tier(MODEL_NAME),
+            )
+        if not tiers:
+            raise ValueError("a cascade needs at least one tier")
+        self.tiers = list(tiers)
+        self.check_consistency = check_consistency
+        self._lock = threading.Lock()
+
+    def run(self, text: str, call: ModelCall) -> CASPArticleEvaluation:
+        """Evaluate *text*, calling ``call(model, hedge)`` tier by tier until accepted."""
+        last_error: Optional[Exception] = None
+        last = len(self.tiers) - 1
+        for index, tier in enumerate(self.tiers):
+            reason = tier.skip_reason(text) if index < last else None
+            if reason:
+                with self._lock:
+                    tier.skipped[reason] += 1
+                continue
+
+            started = time.monotonic()
+            try:
+                evaluation, usage = call(tier.model, tier.hedge)
+            except ValueError as exc:  # JSON decode or Pydantic validation
+                self._record(tier, started, None, escalated="validation")
+                last_error = exc
+                continue
+
+            if index < last and tier.skip_if_complex and (
+                evaluation.article_metadata.study_type.value in _COMPLEX_STUDY_TYPES
+            ):
+                self._record(tier, started, usage, escalated="study_type")
+                continue
+            issues = consistency_issues(evaluation) if self.check_consistency else []
+            if issues and index < last:
+                self._record(tier, started, usage, escalated="consistency")
+                continue
+            self._record(tier, started, usage, accepted=True)
+            return evaluation
+
+        raise last_error or RuntimeError("no cascade tier produced an evaluation")
+
+    def _record(self, tier: Tier, started: float, usage: Any, accepted: bool = False,
+                escalated: Optional[str] = None) -> None:
+        with self._lock:
+            tier.attempts += 1
+            tier.seconds += time.monotonic() - started
+            if usage is not None:
+                tier.prompt_tokens += usage.prompt_token_count or 0
+                tier.output_tokens += usage.candidates_token_count or 0
+            if accepted:
+                tier.accepted += 1
+            if escalated:
+                tier.escalated[escalated] += 1
+
+    def stats(self) -> list:
+        """Per-tier counters, in tier order."""
+        with self._lock:
+            return [tier.stats() for tier in self.tiers]
@@ -0,0 +1,243 @@
+"""Hedged requests for the model call.
+
+A single slow ``generate_content`` call can dominate a batch. With hedging,
+if the first request has not answered by a chosen percentile of recent
+latencies, an identical second request is sent; the first response that
+passes validation wins and the other is cancelled.
+
+Latencies are tracked in an in-process, log-bucketed sliding-window
+histogram. Hedging is capped both as a fraction of recent calls
+(``max_hedge_rate``) and as an absolute number of extra calls
+(``max_extra_calls``) so that a slow upstream cannot double the spend.
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+R = TypeVar("R")
+T = TypeVar("T")
+
+
+# ---------------------------------------------------------------------------
+# Latency histogram
+# ---------------------------------------------------------------------------
+class LatencyHistogram:
+    """Sliding-window latency histogram with logarithmic buckets.
+
+    Bucket ``i`` covers ``(min_s * growth**(i-1), min_s * growth**i]``;
+    percentiles are reported as the upper bound of the bucket containing the
+    requested rank, so they are accurate to within one bucket (~10%).
+    """
+
+    def __init__(
+        self,
+        window: int = 500,
+        min_s: float = 0.05,
+        max_s: float = 600.0,
+        growth: float = 1.1,
+    ):
+        self._min_s = min_s
+        self._log_growth = math.log(growth)
+        self._n_buckets = int(math.ceil(math.log(max_s / min_s) / self._log_growth)) + 1
+        self._bounds = [min_s * growth ** i for i in range(self._n_buckets)]
+        self._counts = [0] * self._n_buckets
+        self._samples: deque[int] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def _bucket(self, seconds: float) -> int:
+        if seconds <= self._min_s:
+            return 0
+        index = int(math.ceil(math.log(seconds / self._min_s) / self._log_growth))
+        return min(index, self._n_buckets - 1)
+
+    def record(self, seconds: float) -> None:
+        bucket = self._bucket(seconds)
+        with self._lock:
+            if len(self._samples) == self._samples.maxlen:
+                self._counts[self._samples[0]] -= 1
+            self._samples.append(bucket)
+            self._counts[bucket] += 1
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Return the *q*-th percentile (0-100) in seconds, or None if empty."""
+        with self._lock:
+            total = len(self._samples)
+            if total == 0:
+                return None
+            rank = max(1, int(math.ceil(q / 100 * total)))
+            seen = 0
+            for bucket, count in enumerate(self._counts):
+                seen += count
+                if seen >= rank:
+                    return self._bounds[bucket]
+        return self._bounds[-1]
+
+
+# ---------------------------------------------------------------------------
+# Policy
+# ---------------------------------------------------------------------------
+class _CallRecord:
+    """One call's slot in the rate window; calls overlap, so each keeps its own."""
+
+    __slots__ = ("hedged",)
+
+    def __init__(self):
+        self.hedged = False
+
+
+class HedgePolicy:
+    """When to hedge, and how much hedging is allowed.
+
+    One instance should be shared by every call it governs: it owns the
+    latency histogram and the hedge-rate / spend counters.
+
+    Args:
+        percentile: Hedge once the primary has been outstanding longer than
+            this percentile of recent latencies.
+        min_samples: Do not hedge until this many latencies have been seen.
+        max_hedge_rate: Maximum fraction of the last ``rate_window`` calls
+            that may be hedged.
+        max_extra_calls: Total number of hedged (duplicate) requests this
+            policy may issue; ``None`` means no absolute cap.
+        rate_window: Number of recent calls used for ``max_hedge_rate``.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        min_samples: int = 20,
+        max_hedge_rate: float = 0.1,
+        max_extra_calls: Optional[int] = None,
+        rate_window: int = 200,
+        histogram: Optional[LatencyHistogram] = None,
+    ):
+        if not 0 < percentile < 100:
+            raise ValueError("percentile must be between 0 and 100")
+        if not 0 <= max_hedge_rate <= 1:
+            raise ValueError("max_hedge_rate must be between 0 and 1")
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_hedge_rate = max_hedge_rate
+        self.max_extra_calls = max_extra_calls
+        self.histogram = histogram or LatencyHistogram()
+        self._recent: deque[_CallRecord] = deque(maxlen=rate_window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None to not hedge this call."""
+        if len(self.histogram) < self.min_samples:
+            return None
+        return self.histogram.percentile(self.percentile)
+
+    def _start_call(self) -> _CallRecord:
+        record = _CallRecord()
+        with self._lock:
+            self.calls += 1
+            self._recent.append(record)
+        return record
+
+    def _try_acquire_hedge(self, record: _CallRecord) -> bool:
+        with self._lock:
+            if self.max_extra_calls is not None and self.hedges >= self.max_extra_calls:
+                return False
+            hedged_recent = sum(r.hedged for r in self._recent) + 1
+            if hedged_recent > self.max_hedge_rate * max(len(self._recent), 1):
+                return False
+            record.hedged = True
+            self.hedges += 1
+            return True
+
+    def _record_win(self, hedge: bool) -> None:
+        if hedge:
+            with self._lock:
+                self.hedge_wins += 1
+
+    def stats(self) -> dict:
+        """Counters and current hedge threshold, for logging/metrics."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedge_rate": self.hedges / self.calls if self.calls else 0.0,
+                "threshold_s": self.hedge_delay(),
+                "samples": len(self.histogram),
+            }
+
+
+# ---------------------------------------------------------------------------
+# Hedged call
+# ---------------------------------------------------------------------------
+async def hedged_call(
+    request: Callable[[], Awaitable[R]],
+    parse: Callable[[R], T],
+    policy: HedgePolicy,
+) -> T:
+    """Run *request*, hedging it according to *policy*.
+
+    *request* is called once per attempt and returns the raw response;
+    *parse* validates it and raises on an invalid response. The first
+    attempt whose response parses wins and any other attempt is cancelled.
+    If every attempt fails, the first error is raised.
+    """
+    import asyncio
+
+    record = policy._start_call()
+
+    async def attempt(hedge: bool) -> tuple[T, bool]:
+        started = time.monotonic()
+        finished = False
+        try:
+            response = await request()
+            finished = True
+        finally:
+            # A primary cancelled because its hedge won is the slow tail the
+            # threshold must see; its elapsed time is a lower bound. A losing
+            # hedge only ran briefly and would drag the percentile down.
+            if finished or not hedge:
+                policy.histogram.record(time.monotonic() - started)
+        return parse(response), hedge
+
+    delay = policy.hedge_delay()
+    pending = {asyncio.ensure_future(attempt(hedge=False))}
+    errors: list[BaseException] = []
+    deadline = time.monotonic() + delay if delay is not None else None
+
+    try:
+        while pending:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic())
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                # Primary is slower than the threshold: hedge at most once.
+                deadline = None
+                if policy._try_acquire_hedge(record):
+                    pending.add(asyncio.ensure_future(attempt(hedge=True)))
+                continue
+            for task in done:
+                try:
+                    result, hedge = task.result()
+                except Exception as exc:
+                    errors.append(exc)
+                    continue
+                policy._record_win(hedge)
+                return result
+        raise errors[0]
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,561 @@
+"""Durable, crash-safe work queue for long appraisal campaigns.
+
+Jobs live in a local SQLite database in WAL mode, so any number of worker
+processes on one host can share it. Each job moves through the pipeline
+stages
+
+    queued -> extracted -> prompted -> generated -> validated -> stored
+
+and every transition commits the stage's artifact (extracted text, prompt,
+raw model response, validated evaluation) in the same transaction. A worker
+that crashes, is redeployed or runs out of quota loses at most the stage it
+was in; the next worker resumes from the last checkpoint. In particular a
+job that reached ``generated`` is never sent to the model again unless its
+response fails validation.
+
+Workers claim jobs with a lease. Every checkpoint is fenced by the lease
+token, so a worker whose lease expired (and whose job was re-claimed) cannot
+overwrite the new owner's progress. The one exception is a model response
+that arrives after the lease ran out: it is salvaged if the job is still
+waiting for one, so the call is not paid for twice. Failed attempts are retried with
+exponential backoff; after ``max_attempts`` claims, or on a permanent error,
+a job is dead-lettered and kept for inspection (``requeue-dead`` revives
+it).
+
+Usage::
+
+    python jobqueue.py enqueue campaign.db review-2024 papers/*.pdf
+    python jobqueue.py work campaign.db --archive archive/ --processes 4
+    python jobqueue.py stats campaign.db
+"""
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from tracing import span
+
+STAGES = ("queued", "extracted", "prompted", "generated", "validated", "stored")
+QUEUED, EXTRACTED, PROMPTED, GENERATED, VALIDATED, STORED = STAGES
+
+# Job status, orthogonal to its pipeline stage.
+READY, LEASED, DONE, DEAD = "ready", "leased", "done", "dead"
+
+LEASE_SECONDS = 600.0
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_S = 30.0
+BACKOFF_MAX_S = 3600.0
+# Retry delay after a quota error (HTTP 429 / RESOURCE_EXHAUSTED). These do
+# not use up an attempt, so a long quota outage cannot dead-letter a campaign.
+QUOTA_RETRY_S = 300.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              INTEGER PRIMARY KEY,
+    campaign        TEXT NOT NULL,
+    document_id     TEXT NOT NULL,
+    source          TEXT NOT NULL,
+    stage           TEXT NOT NULL DEFAULT 'queued',
+    status          TEXT NOT NULL DEFAULT 'ready',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    lease_owner     TEXT,
+    lease_token     TEXT,
+    lease_expires   REAL,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error      TEXT,
+    created_at      REAL NOT NULL,
+    updated_at      REAL NOT NULL,
+    finished_at     REAL,
+    UNIQUE (campaign, document_id)
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS artifacts (
+    job_id     INTEGER NOT NULL REFERENCES jobs (id),
+    name       TEXT NOT NULL,
+    content    TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, name)
+);
+"""
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker may own it now."""
+
+
+class PermanentJobError(Exception):
+    """A failure that retrying cannot fix; the job is dead-lettered at once."""
+
+
+class Job(NamedTuple):
+    id: int
+    campaign: str
+    document_id: str
+    source: str
+    stage: str
+    attempts: int
+    lease_token: str
+
+
+def document_id_for(path: Path) -> str:
+    """Content hash of a PDF, so re-enqueueing the same file is a no-op."""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()[:20]
+
+
+class JobQueue:
+    """A SQLite-backed job queue; one instance per process (or thread)."""
+
+    def __init__(
+        self,
+        path: Path,
+        lease_seconds: float = LEASE_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # FULL: a committed checkpoint (e.g. a paid-for model response)
+        # survives power loss, not just a process crash.
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _transaction(self):
+        return _Transaction(self.db)
+
+    # -- producers ---------------------------------------------------------
+    def enqueue(self, campaign: str, paths: Iterable[Path]) -> int:
+        """Add PDFs to *campaign*, skipping files already in it; return the count added."""
+        now = time.time()
+        rows = [
+            (campaign, document_id_for(p), str(Path(p).resolve()), now, now)
+            for p in paths
+        ]
+        with self._transaction():
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT OR IGNORE INTO jobs (campaign, document_id, source, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            return self.db.total_changes - before
+
+    def requeue_dead(self, campaign: Optional[str] = None) -> int:
+        """Give dead-lettered jobs a fresh set of attempts from their last checkpoint."""
+        query = (
+            "UPDATE jobs SET status = ?, attempts = 0, next_attempt_at = 0, updated_at = ?"
+            " WHERE status = ?"
+        )
+        params: list = [READY, time.time(), DEAD]
+        if campaign is not None:
+            query += " AND campaign = ?"
+            params.append(campaign)
+        with self._transaction():
+            return self.db.execute(query, params).rowcount
+
+    # -- workers -----------------------------------------------------------
+    def claim(self, worker: str, campaign: Optional[str] = None) -> Optional[Job]:
+        """Lease the next runnable job, including ones whose lease expired."""
+        now = time.time()
+        query = (
+            "SELECT id, status, attempts FROM jobs WHERE next_attempt_at <= ? AND "
+            "(status = ? OR (status = ? AND lease_expires < ?))"
+        )
+        params: list = [now, READY, LEASED, now]
+        if campaign is not None:
+            query += " AND campaign = ?"
+            params.append(campaign)
+        query += " ORDER BY next_attempt_at, id LIMIT 1"
+
+        with self._transaction():
+            while True:
+                row = self.db.execute(query, params).fetchone()
+                if row is None:
+                    return None
+                job_id, status, attempts = row
+                if status == READY or attempts < self.max_attempts:
+                    break
+                # Its workers keep dying mid-job (crash, OOM, kill): stop retrying.
+                self.db.execute(
+                    "UPDATE jobs SET status = ?, last_error = ?, lease_owner = NULL,"
+                    " lease_token = NULL, updated_at = ? WHERE id = ?",
+                    (DEAD, f"lease expired on attempt {attempts}", now, job_id),
+                )
+            token = os.urandom(8).hex()
+            self.db.execute(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_token = ?, lease_expires = ?,"
+                " attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (LEASED, worker, token, now + self.lease_seconds, now, job_id),
+            )
+            job = self.db.execute(
+                "SELECT id, campaign, document_id, source, stage, attempts FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        return Job(*job, lease_token=token)
+
+    def _fenced_update(self, job: Job, assignments: str, params: tuple) -> None:
+        cursor = self.db.execute(
+            f"UPDATE jobs SET {assignments}, updated_at = ? "
+            "WHERE id = ? AND lease_token = ? AND status = ?",
+            (*params, time.time(), job.id, job.lease_token, LEASED),
+        )
+        if cursor.rowcount != 1:
+            raise LeaseLost(f"job {job.id} is no longer leased by this worker")
+
+    def renew(self, job: Job) -> Job:
+        """Extend the lease and return *job* with its current stage."""
+        with self._transaction():
+            self._fenced_update(job, "lease_expires = ?", (time.time() + self.lease_seconds,))
+            (stage,) = self.db.execute("SELECT stage FROM jobs WHERE id = ?", (job.id,)).fetchone()
+        return job._replace(stage=stage)
+
+    @contextmanager
+    def heartbeat(self, job: Job):
+        """Keep renewing *job*'s lease while the block runs.
+
+        Stages such as extracting or OCR-ing a large scan can outlast the
+        lease; without renewal another worker would re-claim the job
+        (spending an attempt) while it is still being worked on.
+        """
+        beat = _Heartbeat(self.path, job, self.lease_seconds)
+        beat.start()
+        try:
+            yield beat
+        finally:
+            beat.stop()
+
+    def artifact(self, job: Job, name: str) -> str:
+        row = self.db.execute(
+            "SELECT content FROM artifacts WHERE job_id = ? AND name = ?", (job.id, name)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"job {job.id} has no {name!r} artifact")
+        return row[0]
+
+    def checkpoint(self, job: Job, stage: str, artifacts: Optional[Dict[str, str]] = None) -> Job:
+        """Atomically store *artifacts* and advance *job* to *stage*."""
+        now = time.time()
+        with self._transaction():
+            if stage == STORED:
+                self._fenced_update(
+                    job,
+                    "stage = ?, status = ?, finished_at = ?,"
+                    " lease_owner = NULL, lease_token = NULL",
+                    (stage, DONE, now),
+                )
+            else:
+                self._fenced_update(
+                    job, "stage = ?, lease_expires = ?", (stage, now + self.lease_seconds)
+                )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO artifacts (job_id, name, content, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                [(job.id, name, content, now) for name, content in (artifacts or {}).items()],
+            )
+        return job._replace(stage=stage)
+
+    def salvage(self, job: Job, stage: str, artifacts: Dict[str, str]) -> bool:
+        """Store a paid-for result after this worker lost the lease.
+
+        Unfenced, so a response is not thrown away just because the call
+        outlived the lease: *artifacts* are stored and the job advanced to
+        *stage* only if it is still at ``job.stage``; the lease and status
+        are left to the job's new owner. Returns True if stored.
+        """
+        now = time.time()
+        with self._transaction():
+            cursor = self.db.execute(
+                "UPDATE jobs SET stage = ?, updated_at = ? WHERE id = ? AND stage = ?",
+                (stage, now, job.id, job.stage),
+            )
+            if cursor.rowcount != 1:
+                return False
+            self.db.executemany(
+                "INSERT OR REPLACE INTO artifacts (job_id, name, content, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                [(job.id, name, content, now) for name, content in artifacts.items()],
+            )
+        return True
+
+    def rewind(self, job: Job, stage: str, drop: Iterable[str]) -> Job:
+        """Move *job* back to *stage*, deleting the artifacts in *drop*."""
+        with self._transaction():
+            self._fenced_update(job, "stage = ?", (stage,))
+            self.db.executemany(
+                "DELETE FROM artifacts WHERE job_id = ? AND name = ?",
+                [(job.id, name) for name in drop],
+            )
+        return job._replace(stage=stage)
+
+    def fail(
+        self, job: Job, error: str, permanent: bool = False, throttled: bool = False
+    ) -> bool:
+        """Release *job* for a later retry, or dead-letter it. Returns True if dead.
+
+        A *throttled* failure (quota exhausted) gives the attempt back and
+        retries after ``QUOTA_RETRY_S``; it never dead-letters the job.
+        """
+        if throttled:
+            dead, attempts, delay = False, job.attempts - 1, QUOTA_RETRY_S
+        else:
+            dead = permanent or job.attempts >= self.max_attempts
+            attempts = job.attempts
+            delay = min(BACKOFF_BASE_S * 2 ** (job.attempts - 1), BACKOFF_MAX_S)
+        with self._transaction():
+            self._fenced_update(
+                job,
+                "status = ?, attempts = ?, last_error = ?, next_attempt_at = ?,"
+                " lease_owner = NULL, lease_token = NULL, lease_expires = NULL",
+                (DEAD if dead else READY, attempts, error, time.time() + delay),
+            )
+        return dead
+
+    # -- monitoring --------------------------------------------------------
+    def stats(self, campaign: Optional[str] = None, window_s: float = 3600.0) -> dict:
+        """Backlog by status and stage, throughput over *window_s*, and an ETA."""
+        where, params = ("WHERE campaign = ?", [campaign]) if campaign else ("", [])
+        by_status = dict(self.db.execute(
+            f"SELECT status, COUNT(*) FROM jobs {where} GROUP BY status", params
+        ).fetchall())
+        by_stage = dict(self.db.execute(
+            f"SELECT stage, COUNT(*) FROM jobs {where} {'AND' if where else 'WHERE'} "
+            "status IN (?, ?) GROUP BY stage",
+            [*params, READY, LEASED],
+        ).fetchall())
+        since = time.time() - window_s
+        finished = self.db.execute(
+            f"SELECT COUNT(*) FROM jobs {where} {'AND' if where else 'WHERE'} finished_at >= ?",
+            [*params, since],
+        ).fetchone()[0]
+        backlog = by_status.get(READY, 0) + by_status.get(LEASED, 0)
+        per_hour = finished * 3600.0 / window_s
+        return {
+            "by_status": by_status,
+            "backlog_by_stage": {stage: by_stage.get(stage, 0) for stage in STAGES[:-1]},
+            "backlog": backlog,
+            "done": by_status.get(DONE, 0),
+            "dead": by_status.get(DEAD, 0),
+            "throughput_per_hour": per_hour,
+            "eta_hours": backlog / per_hour if per_hour else None,
+        }
+
+    def dead_letters(self, campaign: Optional[str] = None) -> List[tuple]:
+        where, params = ("AND campaign = ?", [campaign]) if campaign else ("", [])
+        return self.db.execute(
+            f"SELECT document_id, source, stage, attempts, last_error FROM jobs "
+            f"WHERE status = ? {where} ORDER BY id",
+            [DEAD, *params],
+        ).fetchall()
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a lease every third of its length, on its own connection."""
+
+    def __init__(self, path: Path, job: Job, lease_seconds: float):
+        super().__init__(name=f"heartbeat-{job.id}", daemon=True)
+        self.path = path
+        self.job = job
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        queue = JobQueue(self.path, lease_seconds=self.lease_seconds)
+        try:
+            while not self._done.wait(self.lease_seconds / 3):
+                try:
+                    queue.renew(self.job)
+                except LeaseLost:
+                    self.lost = True
+                    return
+        finally:
+            queue.close()
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+
+class _Transaction:
+    """``BEGIN IMMEDIATE`` ... ``COMMIT``/``ROLLBACK`` on an autocommit connection."""
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, _exc, _tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+# ---------------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------------
+def _is_quota_error(exc: Exception) -> bool:
+    """True for HTTP 429 / RESOURCE_EXHAUSTED from the model API."""
+    code, status = getattr(exc, "code", None), getattr(exc, "status", None)
+    return code == 429 or status == "RESOURCE_EXHAUSTED"
+
+
+def process_job(queue: JobQueue, job: Job, client, archive: Path) -> None:
+    """Advance *job* from its checkpoint to ``stored``."""
+    from analysis import MODEL_NAME, build_prompt, call_model, generation_config, parse_evaluation
+    from reevaluation import save_record
+    from triage import extract_document
+
+    if job.stage == QUEUED:
+        with span("job.extract"):
+            text = extract_document(job.source).text
+        if not text.strip():
+            raise PermanentJobError("no text could be extracted (scanned PDF without OCR?)")
+        job = queue.checkpoint(job, EXTRACTED, {"text": text})
+
+    if job.stage == EXTRACTED:
+        prompt = build_prompt(queue.artifact(job, "text"))
+        job = queue.checkpoint(job, PROMPTED, {"prompt": prompt})
+
+    if job.stage == PROMPTED:
+        # Fresh lease for the call, and a fresh stage: a previous owner whose
+        # lease ran out mid-call may have salvaged its response meanwhile.
+        job = queue.renew(job)
+    if job.stage == PROMPTED:
+        raw, _usage = call_model(
+            client, MODEL_NAME, queue.artifact(job, "prompt"), generation_config(),
+            hedge=None, parse=lambda response_text: response_text,
+        )
+        generated = {"response": raw, "model": MODEL_NAME}
+        try:
+            job = queue.checkpoint(job, GENERATED, generated)
+        except LeaseLost:
+            queue.salvage(job, GENERATED, generated)
+            raise
+
+    if job.stage == GENERATED:
+        try:
+            evaluation = parse_evaluation(queue.artifact(job, "response"))
+        except ValueError:
+            # The paid-for response is unusable; only now is a new call allowed.
+            queue.rewind(job, PROMPTED, drop=("response", "model"))
+            raise
+        job = queue.checkpoint(job, VALIDATED, {"evaluation": evaluation.model_dump_json()})
+
+    if job.stage == VALIDATED:
+        from schema import CASPArticleEvaluation
+
+        evaluation = CASPArticleEvaluation.model_validate_json(queue.artifact(job, "evaluation"))
+        save_record(
+            archive, job.document_id, queue.artifact(job, "text"), evaluation,
+            model=queue.artifact(job, "model"),
+        )
+        queue.checkpoint(job, STORED)
+
+
+def run_worker(
+    db_path: Path,
+    archive: Path,
+    api_key: str,
+    campaign: Optional[str] = None,
+    idle_exit: bool = True,
+    poll_s: float = 5.0,
+    lease_seconds: float = LEASE_SECONDS,
+) -> int:
+    """Claim and process jobs until the queue is empty; return jobs stored.
+
+    The lease is renewed by a heartbeat while a job runs, so
+    *lease_seconds* only bounds how long a job held by a dead worker waits
+    before another worker picks it up.
+    """
+    from google import genai
+
+    queue = JobQueue(db_path, lease_seconds=lease_seconds)
+    client = genai.Client(api_key=api_key)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    stored = 0
+    try:
+        while True:
+            job = queue.claim(worker, campaign)
+            if job is None:
+                if idle_exit:
+                    return stored
+                time.sleep(poll_s)
+                continue
+            try:
+                attributes = {"document_id": job.document_id, "stage": job.stage,
+                              "attempt": job.attempts}
+                with span("job", **attributes), queue.heartbeat(job):
+                    process_job(queue, job, client, archive)
+                stored += 1
+            except LeaseLost:
+                continue
+            except PermanentJobError as exc:
+                queue.fail(job, str(exc), permanent=True)
+            except Exception as exc:
+                try:
+                    queue.fail(
+                        job, f"{type(exc).__name__}: {exc}", throttled=_is_quota_error(exc)
+                    )
+                except LeaseLost:
+                    pass
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(description="Durable appraisal campaign queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="add PDFs to a campaign")
+    enqueue.add_argument("db", type=Path)
+    enqueue.add_argument("campaign")
+    enqueue.add_argument("pdfs", nargs="+", type=Path)
+    work = commands.add_parser("work", help="run worker processes")
+    work.add_argument("db", type=Path)
+    work.add_argument("--archive", type=Path, required=True)
+    work.add_argument("--campaign")
+    work.add_argument("--processes", type=int, default=1)
+    work.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"))
+    work.add_argument("--follow", action="store_true", help="keep polling when idle")
+    work.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+    stats = commands.add_parser("stats", help="backlog, throughput and dead letters")
+    stats.add_argument("db", type=Path)
+    stats.add_argument("--campaign")
+    requeue = commands.add_parser("requeue-dead", help="retry dead-lettered jobs")
+    requeue.add_argument("db", type=Path)
+    requeue.add_argument("--campaign")
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        added = JobQueue(args.db).enqueue(args.campaign, args.pdfs)
+        print(f"enqueued {added} of {len(args.pdfs)} PDFs")
+    elif args.command == "work":
+        if not args.api_key:
+            parser.error("--api-key or GOOGLE_API_KEY is required")
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            futures = [
+                pool.submit(run_worker, args.db, args.archive, args.api_key,
+                            args.campaign, not args.follow, lease_seconds=args.lease_seconds)
+                for _ in range(args.processes)
+            ]
+            print(f"stored {sum(f.result() for f in futures)} evaluations")
+    elif args.command == "stats":
+        queue = JobQueue(args.db)
+        print(json.dumps(queue.stats(args.campaign), indent=2))
+        for row in queue.dead_letters(args.campaign):
+            print("DEAD", *row, sep="\t")
+    else:
+        print(f"requeued {JobQueue(args.db).requeue_dead(args.campaign)} jobs")
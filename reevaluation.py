@@ -0,0 +1,449 @@
+"""Versioned evaluation records and incremental re-evaluation.
+
+An archive is a directory holding, per document, ``<id>.json`` (an
+``EvaluationRecord``) and ``<id>.txt`` (the cached extracted text). Each
+record stores a fingerprint per *unit* of the evaluation:
+
+* every model-typed field two levels below the root, e.g.
+  ``additional_quality_assessment.mechanistic_strength``, and
+* the remaining scalar fields of each root section, e.g. ``casp_evaluation``
+  (``checklist_used``, ``evaluation_date``, ...) or ``overall_assessment``.
+
+A unit's fingerprint hashes its JSON-schema fragment (with every ``$defs``
+entry it references) and the ``SYSTEM_PROMPT`` sections that apply to it.
+After an edit to ``schema.py`` or the prompt, ``plan_migration`` compares
+the stored fingerprints with the current ones and ``reevaluate`` asks the
+model for the stale units only, giving it the cached text and the
+still-valid parts as context, then patches the records in place.
+
+Usage::
+
+    python reevaluation.py plan ARCHIVE
+    python reevaluation.py run ARCHIVE [--api-key KEY] [--workers 4]
+"""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from analysis import MODEL_NAME, SYSTEM_PROMPT
+from extraction import estimate_tokens
+from schema_artifact import load_json_schema
+
+RECORD_VERSION = 1
+
+# SYSTEM_PROMPT sections that only concern some units (matched by path
+# prefix). Every other section (the preamble, framework selection, field
+# guidance) applies to all units, so editing it marks everything stale.
+PROMPT_SCOPES: Dict[str, Tuple[str, ...]] = {
+    "CASP EVALUATION (FOR ORIGINAL ARTICLES)": ("casp_evaluation",),
+    "GRADE CERTAINTY OF EVIDENCE": ("overall_assessment", "additional_quality_assessment"),
+    "CROSS-MODEL VALIDATION & CONFLICTS": ("overall_assessment",),
+    "CRITICAL APPRAISAL: WHAT WAS NOT CONSIDERED?": ("overall_assessment",),
+    "SCIENTIFIC JUSTIFICATION (REQUIRED)": ("overall_assessment",),
+    "SCORING CALCULATION (DETERMINISTIC)": ("overall_assessment",),
+}
+
+# The overall scores are derived from the CASP question scores, so the
+# overall assessment is regenerated whenever any CASP unit is.
+DEPENDENTS: Dict[str, Tuple[str, ...]] = {
+    "overall_assessment": ("casp_evaluation",),
+}
+
+_BANNER = re.compile(r"^═+\n(.+)\n═+\n", re.MULTILINE)
+
+
+# ---------------------------------------------------------------------------
+# Records
+# ---------------------------------------------------------------------------
+class EvaluationRecord(NamedTuple):
+    document_id: str
+    model: str  # produced the original evaluation
+    updated: str
+    fingerprints: Dict[str, str]
+    # Kept as plain JSON so records written under an older schema still load.
+    evaluation: dict
+    record_version: int = RECORD_VERSION
+    revision: int = 1
+    # Model that last regenerated each patched unit; other units are ``model``'s.
+    unit_models: Optional[Dict[str, str]] = None
+
+    def to_json(self) -> str:
+        return json.dumps(self._asdict(), indent=2)
+
+    @classmethod
+    def from_json(cls, content: str) -> EvaluationRecord:
+        data = json.loads(content)
+        missing = [f for f in cls._fields if f not in data and f not in cls._field_defaults]
+        if missing:
+            raise ValueError(f"evaluation record is missing {missing}")
+        return cls(**{name: data[name] for name in cls._fields if name in data})
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(content, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def save_record(
+    archive: Path,
+    document_id: str,
+    text: str,
+    evaluation,
+    model: str = MODEL_NAME,
+) -> EvaluationRecord:
+    """Store a fresh evaluation and its extracted text in *archive*."""
+    archive = Path(archive)
+    archive.mkdir(parents=True, exist_ok=True)
+    record = EvaluationRecord(
+        document_id=document_id,
+        model=model,
+        updated=_now(),
+        fingerprints=current_fingerprints(),
+        evaluation=evaluation.model_dump(mode="json"),
+    )
+    _write_atomic(archive / f"{document_id}.txt", text)
+    _write_atomic(archive / f"{document_id}.json", record.to_json())
+    return record
+
+
+def load_records(archive: Path) -> List[EvaluationRecord]:
+    return [
+        EvaluationRecord.from_json(path.read_text(encoding="utf-8"))
+        for path in sorted(Path(archive).glob("*.json"))
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Fingerprints
+# ---------------------------------------------------------------------------
+def _hash(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def _ref_name(prop: dict) -> Optional[str]:
+    ref = prop.get("$ref", "")
+    return ref.rsplit("/", 1)[-1] if ref.startswith("#/$defs/") else None
+
+
+def _with_defs(fragment: dict, defs: dict) -> dict:
+    """Attach the transitive closure of ``$defs`` that *fragment* references."""
+    needed: Dict[str, dict] = {}
+    stack = [fragment]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            name = _ref_name(node)
+            if name and name not in needed:
+                needed[name] = defs[name]
+                stack.append(defs[name])
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return {**fragment, "$defs": dict(sorted(needed.items()))} if needed else fragment
+
+
+def schema_units(schema: Optional[dict] = None) -> Dict[str, dict]:
+    """Split the root JSON schema into self-contained per-unit fragments.
+
+    A unit ``"<section>.<field>"`` maps to the schema of that field's object;
+    a unit ``"<section>"`` maps to an object schema of the section's other
+    fields. This is the shape the re-evaluation prompt asks the model for.
+    """
+    schema = schema or load_json_schema()
+    defs = schema.get("$defs", {})
+    units: Dict[str, dict] = {}
+    for section, section_prop in schema["properties"].items():
+        section_def = defs[_ref_name(section_prop)]
+        required = set(section_def.get("required", ()))
+        own: Dict[str, dict] = {}
+        for field, prop in section_def["properties"].items():
+            target = _ref_name(prop)
+            if target and "properties" in defs[target]:
+                units[f"{section}.{field}"] = _with_defs(prop, defs)
+            else:
+                own[field] = prop
+        if own:
+            units[section] = _with_defs(
+                {
+                    "type": "object",
+                    "properties": own,
+                    "required": sorted(required & own.keys()),
+                },
+                defs,
+            )
+    return units
+
+
+def prompt_sections(prompt: str = SYSTEM_PROMPT) -> List[Tuple[str, str]]:
+    """Split *prompt* at its ═══ banners into ``(title, text)`` pairs.
+
+    The text before the first banner is returned with the title ``""``.
+    """
+    matches = list(_BANNER.finditer(prompt))
+    sections = [("", prompt[: matches[0].start()] if matches else prompt)]
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(prompt)
+        sections.append((match.group(1).strip(), prompt[match.start():end]))
+    return sections
+
+
+def _in_scope(unit: str, scopes: Tuple[str, ...]) -> bool:
+    return any(unit == scope or unit.startswith(scope + ".") for scope in scopes)
+
+
+def _sections_for(unit: str, sections: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    return [
+        (title, text)
+        for title, text in sections
+        if title not in PROMPT_SCOPES or _in_scope(unit, PROMPT_SCOPES[title])
+    ]
+
+
+def current_fingerprints(
+    schema: Optional[dict] = None,
+    prompt: str = SYSTEM_PROMPT,
+) -> Dict[str, str]:
+    """Return ``{unit: fingerprint}`` for the current schema and prompt."""
+    sections = prompt_sections(prompt)
+    return {
+        unit: _hash({
+            "schema": fragment,
+            "prompt": [text for _, text in _sections_for(unit, sections)],
+        })
+        for unit, fragment in (schema_units(schema) if schema else _current_units()).items()
+    }
+
+
+# ---------------------------------------------------------------------------
+# Planning
+# ---------------------------------------------------------------------------
+def stale_units(record: EvaluationRecord, fingerprints: Dict[str, str]) -> List[str]:
+    """Units of *record* whose schema or prompt changed, plus their dependents."""
+    stale = {unit for unit, fp in fingerprints.items() if record.fingerprints.get(unit) != fp}
+    for dependent, sources in DEPENDENTS.items():
+        if dependent in fingerprints and any(_in_scope(unit, sources) for unit in stale):
+            stale.add(dependent)
+    return sorted(stale)
+
+
+@lru_cache(maxsize=1)
+def _current_units() -> Dict[str, dict]:
+    return schema_units()
+
+
+def _get(evaluation: dict, unit: str):
+    section, _, field = unit.partition(".")
+    value = evaluation.get(section, {})
+    if field:
+        return value.get(field)
+    units = _current_units()
+    return {k: v for k, v in value.items() if k in units[unit]["properties"]}
+
+
+class MigrationPlan(NamedTuple):
+    stale: Dict[str, List[str]]  # document_id -> stale units
+    unit_counts: Dict[str, int]
+    records: int
+    # Estimated tokens (input, output) for a full rerun vs. the plan.
+    full_tokens: Tuple[int, int]
+    plan_tokens: Tuple[int, int]
+
+    def summary(self) -> str:
+        lines = [f"{len(self.stale)} of {self.records} records have stale units"]
+        lines += [f"  {unit}: {count}" for unit, count in sorted(self.unit_counts.items())]
+        for label, (full, planned) in (
+            ("input", (self.full_tokens[0], self.plan_tokens[0])),
+            ("output", (self.full_tokens[1], self.plan_tokens[1])),
+        ):
+            share = planned / full if full else 0.0
+            lines.append(f"  {label} tokens: {planned:,} of {full:,} for a full rerun ({share:.1%})")
+        return "\n".join(lines)
+
+
+def plan_migration(archive: Path) -> MigrationPlan:
+    """Work out which units of which stored evaluations are stale."""
+    from analysis import get_json_schema
+
+    archive = Path(archive)
+    fingerprints = current_fingerprints()
+    full_in = full_out = plan_in = plan_out = 0
+    stale: Dict[str, List[str]] = {}
+    counts: Dict[str, int] = {}
+    records = load_records(archive)
+    fixed_prompt = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(get_json_schema())
+    for record in records:
+        text = (archive / f"{record.document_id}.txt").read_text(encoding="utf-8")
+        text_tokens = estimate_tokens(text)
+        full_in += fixed_prompt + text_tokens
+        full_out += estimate_tokens(json.dumps(record.evaluation))
+        units = stale_units(record, fingerprints)
+        if not units:
+            continue
+        stale[record.document_id] = units
+        for unit in units:
+            counts[unit] = counts.get(unit, 0) + 1
+        plan_in += estimate_tokens(_build_patch_prompt(record.evaluation, units, "")) + text_tokens
+        plan_out += sum(estimate_tokens(json.dumps(_get(record.evaluation, unit))) for unit in units)
+    return MigrationPlan(
+        stale=stale,
+        unit_counts=counts,
+        records=len(records),
+        full_tokens=(full_in, full_out),
+        plan_tokens=(plan_in, plan_out),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Re-evaluation
+# ---------------------------------------------------------------------------
+def _build_patch_prompt(evaluation: dict, units: List[str], text: str) -> str:
+    all_units = _current_units()
+    sections = prompt_sections()
+    wanted = {title for unit in units for title, _ in _sections_for(unit, sections)}
+    instructions = "".join(body for title, body in sections if title in wanted)
+
+    context = copy.deepcopy(evaluation)
+    for unit in units:
+        section, _, field = unit.partition(".")
+        if field:
+            context.get(section, {}).pop(field, None)
+        else:
+            for name in all_units[unit]["properties"]:
+                context.get(section, {}).pop(name, None)
+
+    target = {
+        "type": "object",
+        "properties": {unit: all_units[unit] for unit in units},
+        "required": list(units),
+    }
+    return (
+        f"{instructions}\n\n"
+        "You are UPDATING an existing evaluation of the article below. These parts "
+        "are still valid; keep your answer consistent with them and do not repeat them:\n"
+        f"```\n{json.dumps(context, indent=1)}\n```\n\n"
+        "Produce a single JSON object with exactly these keys, each conforming to its "
+        "JSON Schema:\n"
+        f"```\n{json.dumps(target, indent=1)}\n```\n\n"
+        f"--- BEGIN ARTICLE TEXT ---\n{text}\n--- END ARTICLE TEXT ---"
+    )
+
+
+def _patch(evaluation: dict, units: List[str], response_text: str) -> dict:
+    """Merge the model's units into a copy of *evaluation* and validate it."""
+    from schema import CASPArticleEvaluation
+
+    values = json.loads(response_text)
+    missing = [unit for unit in units if unit not in values]
+    if missing:
+        raise ValueError(f"response is missing units: {missing}")
+    patched = copy.deepcopy(evaluation)
+    for unit in units:
+        section, _, field = unit.partition(".")
+        target = patched.setdefault(section, {})
+        if field:
+            target[field] = values[unit]
+        else:
+            target.update(values[unit])
+    # Store the validated form, so coerced values (enums, numeric strings)
+    # are normalised in the record.
+    return CASPArticleEvaluation(**patched).model_dump(mode="json")
+
+
+def reevaluate_record(
+    archive: Path,
+    record: EvaluationRecord,
+    units: List[str],
+    client,
+    model: str = MODEL_NAME,
+) -> EvaluationRecord:
+    """Regenerate *units* of *record* and rewrite it in place."""
+    from analysis import call_model, generation_config
+
+    archive = Path(archive)
+    text = (archive / f"{record.document_id}.txt").read_text(encoding="utf-8")
+    prompt = _build_patch_prompt(record.evaluation, units, text)
+    patched, _usage = call_model(
+        client, model, prompt, generation_config(), hedge=None,
+        parse=lambda response_text: _patch(record.evaluation, units, response_text),
+    )
+    fingerprints = current_fingerprints()
+    updated = record._replace(
+        evaluation=patched,
+        fingerprints={
+            unit: fp for unit, fp in fingerprints.items()
+            if unit in units or record.fingerprints.get(unit) == fp
+        },
+        revision=record.revision + 1,
+        updated=_now(),
+        unit_models={**(record.unit_models or {}), **{unit: model for unit in units}},
+    )
+    _write_atomic(archive / f"{record.document_id}.json", updated.to_json())
+    return updated
+
+
+def reevaluate(
+    archive: Path,
+    api_key: str,
+    plan: Optional[MigrationPlan] = None,
+    workers: int = 4,
+    model: str = MODEL_NAME,
+) -> Dict[str, str]:
+    """Apply *plan* (or a fresh one); return ``{document_id: error}`` for failures.
+
+    A record whose patched evaluation fails validation is left untouched, so
+    the run can simply be repeated.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from google import genai
+
+    archive = Path(archive)
+    plan = plan or plan_migration(archive)
+    client = genai.Client(api_key=api_key)
+    records = {r.document_id: r for r in load_records(archive) if r.document_id in plan.stale}
+
+    def run(document_id: str) -> Optional[str]:
+        try:
+            reevaluate_record(archive, records[document_id], plan.stale[document_id], client, model)
+        except Exception as exc:
+            return f"{type(exc).__name__}: {exc}"
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = dict(zip(plan.stale, pool.map(run, plan.stale)))
+    return {document_id: error for document_id, error in results.items() if error}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incremental re-evaluation of an archive")
+    parser.add_argument("command", choices=("plan", "run"))
+    parser.add_argument("archive", type=Path)
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--model", default=MODEL_NAME)
+    args = parser.parse_args()
+
+    migration = plan_migration(args.archive)
+    print(migration.summary())
+    if args.command == "run":
+        if not args.api_key:
+            parser.error("--api-key or GOOGLE_API_KEY is required")
+        failures = reevaluate(args.archive, args.api_key, migration, args.workers, args.model)
+        for document_id, error in failures.items():
+            print(f"FAILED {document_id}: {error}")
+        print(f"patched {len(migration.stale) - len(failures)} records, {len(failures)} failed")
@@ -0,0 +1,52 @@
+"""Precomputed JSON schema for ``CASPArticleEvaluation``.
+
+Building the ~40 Pydantic models in ``schema.py`` and walking them with
+``model_json_schema()`` is the most expensive part of preparing a prompt.
+The schema only changes when ``schema.py`` does, so it is written once to
+``casp_schema.json`` together with a hash of ``schema.py`` and loaded from
+there afterwards. A missing or stale artifact falls back to the models.
+
+Regenerate after editing ``schema.py``::
+
+    python schema_artifact.py
+"""
+import hashlib
+import json
+from pathlib import Path
+
+_HERE = Path(__file__).resolve().parent
+SCHEMA_SOURCE = _HERE / "schema.py"
+ARTIFACT_PATH = _HERE / "casp_schema.json"
+
+
+def _source_hash() -> str:
+    return hashlib.sha256(SCHEMA_SOURCE.read_bytes()).hexdigest()
+
+
+def build_json_schema() -> dict:
+    """Build the JSON schema from the Pydantic root model (slow path)."""
+    from schema import CASPArticleEvaluation
+
+    return CASPArticleEvaluation.model_json_schema()
+
+
+def load_json_schema() -> dict:
+    """Return the root JSON schema, from the artifact when it is up to date."""
+    try:
+        artifact = json.loads(ARTIFACT_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return build_json_schema()
+    if artifact.get("source_sha256") != _source_hash():
+        return build_json_schema()
+    return artifact["schema"]
+
+
+def write_artifact(path: Path = ARTIFACT_PATH) -> Path:
+    """Rebuild the schema from the models and write it to *path*."""
+    artifact = {"source_sha256": _source_hash(), "schema": build_json_schema()}
+    path.write_text(json.dumps(artifact, indent=2) + "\n", encoding="utf-8")
+    return path
+
+
+if __name__ == "__main__":
+    print(f"Wrote {write_artifact()}")
@@ -0,0 +1,110 @@
+"""Deterministic scoring rules and internal-consistency checks.
+
+These mirror the SCORING CALCULATION section of ``SYSTEM_PROMPT``: the raw
+CASP score is the sum of the Q1-Q11 scores (a Q11 answered NOT_APPLICABLE
+or scored "N/A" is excluded from the denominator), the percentage is that sum over
+the applicable questions, reduced by at most 25 points for GRADE, and the
+quality rating follows fixed thresholds.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    from schema import CASPArticleEvaluation
+
+
+# Largest GRADE reduction the prompt allows (VERY_LOW: 15-25 points).
+MAX_GRADE_ADJUSTMENT = 25.0
+
+# Slack for rounding in model-reported scores.
+SCORE_TOLERANCE = 0.05
+PERCENT_TOLERANCE = 1.0
+
+_RATING_THRESHOLDS = (
+    (80.0, "HIGH"),
+    (65.0, "MODERATE_TO_HIGH"),
+    (40.0, "MODERATE"),
+)
+_RATING_ORDER = ("LOW", "MODERATE", "MODERATE_TO_HIGH", "HIGH")
+
+
+def rating_for_percentage(percentage: float) -> str:
+    """Return the QualityRating value for a final percentage score."""
+    for threshold, rating in _RATING_THRESHOLDS:
+        if percentage >= threshold:
+            return rating
+    return "LOW"
+
+
+def question_scores(evaluation: CASPArticleEvaluation) -> List[float]:
+    """Return the Q1-Q11 scores, skipping Q11 when it is not applicable.
+
+    Q11 counts unless answered NOT_APPLICABLE or scored with a non-numeric
+    string such as "N/A"; numeric strings ("0.5") are converted.
+    """
+    casp = evaluation.casp_evaluation
+    a, b, c = casp.section_a_validity, casp.section_b_results, casp.section_c_applicability
+    scores = [
+        a.question_1_focused_issue.score,
+        a.question_2_randomization.score,
+        a.question_3_all_patients_accounted.score,
+        b.question_4_blinding.score,
+        b.question_5_groups_similar.score,
+        b.question_6_treated_equally.score,
+        b.question_7_effect_size.score,
+        b.question_8_precision.score,
+        c.question_9_results_applicable.score,
+        c.question_10_outcomes_considered.score,
+    ]
+    q11 = c.question_11_benefits_worth_harms
+    if q11.answer != "NOT_APPLICABLE":
+        try:
+            scores.append(float(q11.score))
+        except (TypeError, ValueError):
+            pass
+    return scores
+
+
+def consistency_issues(evaluation: CASPArticleEvaluation) -> List[str]:
+    """Return human-readable disagreements between the overall and question scores.
+
+    An empty list means the evaluation is internally consistent.
+    """
+    issues: List[str] = []
+    oa = evaluation.overall_assessment
+    scores = question_scores(evaluation)
+
+    out_of_range = [s for s in scores if not 0.0 <= s <= 1.0]
+    if out_of_range:
+        issues.append(f"question scores outside [0, 1]: {out_of_range}")
+
+    total = sum(scores)
+    if abs(oa.total_score - total) > SCORE_TOLERANCE:
+        issues.append(f"total_score {oa.total_score} != sum of question scores {total:g}")
+
+    if oa.total_applicable_questions != len(scores):
+        issues.append(
+            f"total_applicable_questions {oa.total_applicable_questions} != "
+            f"{len(scores)} scored questions"
+        )
+
+    preliminary = total / len(scores) * 100
+    lowest = max(0.0, preliminary - MAX_GRADE_ADJUSTMENT) - PERCENT_TOLERANCE
+    if not lowest <= oa.percentage_score <= preliminary + PERCENT_TOLERANCE:
+        issues.append(
+            f"percentage_score {oa.percentage_score:g} outside "
+            f"[{max(0.0, preliminary - MAX_GRADE_ADJUSTMENT):.1f}, {preliminary:.1f}] "
+            "implied by the question scores"
+        )
+
+    # A documented CASP/GRADE conflict may cap the rating below the threshold.
+    expected = rating_for_percentage(oa.percentage_score)
+    rating = oa.quality_rating.value
+    capped = oa.cross_model_conflicts and _RATING_ORDER.index(rating) < _RATING_ORDER.index(expected)
+    if rating != expected and not capped:
+        issues.append(
+            f"quality_rating {rating} does not match "
+            f"percentage_score {oa.percentage_score:g} ({expected})"
+        )
+    return issues
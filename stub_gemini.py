@@ -0,0 +1,221 @@
+"""Local stub of the Gemini ``generateContent`` endpoint for benchmarks.
+
+The google-genai SDK honours ``GOOGLE_GEMINI_BASE_URL``, so pointing it at
+``StubGemini.url`` exercises the real client code (HTTP, retries, parsing)
+without network access or quota. Latency and response text are injectable
+per request.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+
+def sample_evaluation(percentage_score: float = 72.7) -> dict:
+    """Return a minimal ``CASPArticleEvaluation`` payload that validates."""
+    q = "Placeholder question"
+    notes = {"limitations_found": []}
+    return {
+        "article_metadata": {
+            "title": "Stub trial",
+            "authors": ["A. Author"],
+            "journal": "Stub Journal",
+            "publication_year": 2024,
+            "doi": "10.0000/stub",
+            "study_type": "ORIGINAL_ARTICLE",
+            "frameworks_applied": ["CASP", "GRADE", "PICO"],
+        },
+        "casp_evaluation": {
+            "checklist_used": "CASP_RCT",
+            "evaluation_date": "2024-01-01",
+            "section_a_validity": {
+                "question_1_focused_issue": {
+                    "question": q, "answer": "YES", "score": 1.0,
+                    "details": {"population": "adults", "intervention": "drug",
+                                "comparator": "placebo", "outcomes": "mortality"},
+                },
+                "question_2_randomization": {
+                    "question": q, "answer": "YES", "score": 1.0, "concerns": [],
+                    "details": {"mice_studies": "NOT_APPLICABLE",
+                                "human_intervention": "computer generated",
+                                "human_observational": "NOT_APPLICABLE"},
+                },
+                "question_3_all_patients_accounted": {
+                    "question": q, "answer": "YES", "score": 1.0,
+                    "details": {"mice": "NOT_APPLICABLE", "humans": "ITT"},
+                },
+                "preliminary_assessment": {"worth_continuing": True, "rationale": "ok"},
+            },
+            "section_b_results": {
+                "question_4_blinding": {
+                    "question": q, "answer": "PARTIAL", "score": 0.5,
+                    "bias_risk": "MODERATE", "concerns": [],
+                    "details": {"patients_blinded": True, "personnel_blinded": False,
+                                "explicit_statement": "single blind"},
+                },
+                "question_5_groups_similar": {
+                    "question": q, "answer": "YES", "score": 1.0,
+                    "details": {"baseline_characteristics": "similar",
+                                "human_baseline": "similar",
+                                "baseline_measurements": "similar"},
+                },
+                "question_6_treated_equally": {
+                    "question": q, "answer": "YES", "score": 1.0,
+                    "details": {"same_diet_batch": "NOT_APPLICABLE",
+                                "same_housing": "NOT_APPLICABLE",
+                                "same_testing": "yes"},
+                },
+                "question_7_effect_size": {
+                    "question": q, "answer": "MODERATE", "score": 0.5,
+                    "details": {"primary_outcome_mice": "NOT_APPLICABLE",
+                                "primary_outcome_humans": "RR 0.8",
+                                "mechanistic_outcomes": "NOT_APPLICABLE"},
+                },
+                "question_8_precision": {
+                    "question": q, "answer": "MODERATE", "score": 0.5, "concerns": [],
+                    "details": {"confidence_intervals": "0.7-0.9", "p_values": "0.01",
+                                "error_reporting": "SD",
+                                "sample_sizes": {"mice_groups": "NOT_APPLICABLE",
+                                                 "human_observational": "NOT_APPLICABLE",
+                                                 "human_intervention": "400"}},
+                },
+            },
+            "section_c_applicability": {
+                "question_9_results_applicable": {
+                    "question": q, "answer": "YES", "score": 1.0,
+                    "details": {"generalizability_limitations": [], "strengths": []},
+                },
+                "question_10_outcomes_considered": {
+                    "question": q, "answer": "PARTIAL", "score": 0.5,
+                    "details": {"outcomes_measured": ["mortality"], "outcomes_missing": []},
+                },
+                "question_11_benefits_worth_harms": {
+                    "question": q, "answer": "PARTIAL", "score": 0.5,
+                    "details": {"type": "drug", "findings_suggest": "benefit",
+                                "clinical_implications": "some"},
+                },
+            },
+        },
+        "additional_quality_assessment": {
+            "internal_validity": {
+                bias: {"risk": "LOW", "notes": "ok"}
+                for bias in ("selection_bias", "performance_bias", "detection_bias",
+                             "attrition_bias", "reporting_bias")
+            },
+            "external_validity": {},
+            "statistical_rigor": {},
+            "mechanistic_strength": {"causality_evidence": [], "bradford_hill_criteria_met": 3},
+            **notes,
+        },
+        "overall_assessment": {
+            "total_applicable_questions": 11,
+            "total_score": 8.5,
+            "percentage_score": percentage_score,
+            "quality_rating": "MODERATE_TO_HIGH",
+            "key_strengths": ["randomised"],
+            "key_limitations": ["partial blinding"],
+            "reliability_conclusion": "reasonably reliable",
+            "recommendations": ["replicate"],
+            "what_was_not_considered": ["long-term outcomes"],
+            "scientific_justification": "stub",
+        },
+    }
+
+
+def outlier_latency(
+    median_s: float = 0.05,
+    outlier_s: float = 1.0,
+    outlier_rate: float = 0.05,
+    seed: Optional[int] = 0,
+) -> Callable[[dict], float]:
+    """Latency model: mostly around *median_s*, occasionally *outlier_s*."""
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def latency(_request: dict) -> float:
+        with lock:
+            if rng.random() < outlier_rate:
+                return outlier_s
+            return rng.uniform(0.8, 1.2) * median_s
+
+    return latency
+
+
+class StubGemini:
+    """Threaded HTTP stub answering ``models/*:generateContent``.
+
+    The callables receive the request as ``{"path", "model", "body"}``.
+
+    Args:
+        latency: Seconds to sleep before answering.
+        respond: Response text (defaults to a valid ``sample_evaluation()``).
+        status: HTTP status; anything but 200 returns an API error body
+            instead (429 as ``RESOURCE_EXHAUSTED``).
+    """
+
+    def __init__(
+        self,
+        latency: Callable[[dict], float] = lambda _request: 0.0,
+        respond: Optional[Callable[[dict], str]] = None,
+        status: Callable[[dict], int] = lambda _request: 200,
+    ):
+        self.latency = latency
+        self.respond = respond or (lambda _request: json.dumps(sample_evaluation()))
+        self.status = status
+        self.requests: list[dict] = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                model = self.path.rsplit("/", 1)[-1].split(":", 1)[0]
+                request = {"path": self.path, "model": model, "body": body}
+                stub.requests.append(request)
+                time.sleep(stub.latency(request))
+                code = stub.status(request)
+                if code == 200:
+                    payload = json.dumps({
+                        "candidates": [{
+                            "content": {"role": "model",
+                                        "parts": [{"text": stub.respond(request)}]},
+                            "finishReason": "STOP",
+                        }],
+                        "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": 0},
+                    }).encode()
+                else:
+                    payload = json.dumps({"error": {
+                        "code": code,
+                        "message": "stub error",
+                        "status": "RESOURCE_EXHAUSTED" if code == 429 else "INTERNAL",
+                    }}).encode()
+                try:
+                    self.send_response(code)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client cancelled (e.g. the losing side of a hedge)
+
+            def log_message(self, *_args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def __enter__(self) -> "StubGemini":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,133 @@
+"""Tier selection and escalation in ``cascade.py``.
+
+Run with ``python -m pytest test_cascade.py``. Model calls are scripted
+through ``analysis.parse_evaluation``, so no server is needed.
+"""
+import json
+
+import pytest
+
+from analysis import parse_evaluation
+from cascade import Cascade, Tier, is_complex
+from stub_gemini import sample_evaluation
+
+FAST, STRONG = "gemini-2.5-flash-lite", "gemini-2.5-flash"
+RCT = "Drug versus placebo for hypertension: a randomised controlled trial\n"
+
+
+def _cascade(**fast) -> Cascade:
+    fast.setdefault("skip_if_complex", True)
+    return Cascade([Tier(FAST, **fast), Tier(STRONG)])
+
+
+def _scripted(responses: dict):
+    """A ``ModelCall`` answering each model with its scripted response text."""
+    calls = []
+
+    def call(model, _hedge):
+        calls.append(model)
+        return parse_evaluation(responses[model]), None
+
+    call.calls = calls
+    return call
+
+
+def _response(**metadata) -> str:
+    data = sample_evaluation()
+    data["article_metadata"].update(metadata)
+    return json.dumps(data)
+
+
+GOOD = _response()
+INCONSISTENT = json.dumps(sample_evaluation(percentage_score=95.0))
+
+
+def test_fast_tier_accepted():
+    cascade = _cascade()
+    call = _scripted({FAST: GOOD, STRONG: GOOD})
+
+    cascade.run(RCT, call)
+
+    assert call.calls == [FAST]
+    assert cascade.stats()[0]["accepted"] == 1
+
+
+@pytest.mark.parametrize("bad", ['{"truncated": ', "", "not json"])
+def test_escalates_on_invalid_response(bad):
+    cascade = _cascade()
+    call = _scripted({FAST: bad, STRONG: GOOD})
+
+    cascade.run(RCT, call)
+
+    assert call.calls == [FAST, STRONG]
+    assert cascade.stats()[0]["escalated"] == {"validation": 1}
+
+
+def test_escalates_on_inconsistent_answer():
+    cascade = _cascade()
+    call = _scripted({FAST: INCONSISTENT, STRONG: GOOD})
+
+    cascade.run(RCT, call)
+
+    assert call.calls == [FAST, STRONG]
+    assert cascade.stats()[0]["escalated"] == {"consistency": 1}
+
+
+def test_escalates_on_review_study_type():
+    cascade = _cascade()
+    call = _scripted({FAST: _response(study_type="META_ANALYSIS"), STRONG: GOOD})
+
+    cascade.run(RCT, call)
+
+    assert call.calls == [FAST, STRONG]
+    assert cascade.stats()[0]["escalated"] == {"study_type": 1}
+
+
+def test_skips_tier_by_size():
+    cascade = _cascade(max_chars=100)
+    call = _scripted({FAST: GOOD, STRONG: GOOD})
+
+    cascade.run(RCT + "x" * 200, call)
+
+    assert call.calls == [STRONG]
+    assert cascade.stats()[0]["skipped"] == {"size": 1}
+
+
+def test_last_tier_always_accepted():
+    cascade = _cascade()
+    call = _scripted({FAST: INCONSISTENT, STRONG: INCONSISTENT})
+
+    evaluation = cascade.run(RCT, call)
+
+    assert evaluation.overall_assessment.percentage_score == 95.0
+    assert cascade.stats()[1]["accepted"] == 1
+
+
+def test_last_tier_invalid_raises():
+    call = _scripted({FAST: "{", STRONG: "{"})
+
+    with pytest.raises(ValueError):
+        _cascade().run(RCT, call)
+
+
+def test_rct_citing_meta_analysis_is_not_complex():
+    text = RCT + (
+        "Background: Previous meta-analyses suggested a benefit, and a systematic "
+        "review called for larger trials.\n"
+    )
+    assert not is_complex(text)
+
+    call = _scripted({FAST: GOOD, STRONG: GOOD})
+    _cascade().run(text, call)
+    assert call.calls == [FAST]
+
+
+@pytest.mark.parametrize("text", [
+    "Statins for primary prevention: a systematic review and meta-analysis\n",
+    "A network meta-analysis of antihypertensive drugs\n",
+    "Methods: We conducted a systematic review of randomised trials.",
+    "Reporting followed the PRISMA statement.",
+    "We searched MEDLINE and Embase from inception.",
+])
+def test_review_designs_are_complex(text):
+    assert is_complex(text)
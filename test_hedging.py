@@ -0,0 +1,167 @@
+"""Hedged model calls against ``stub_gemini.StubGemini``.
+
+Run with ``python -m pytest test_hedging.py``. The real google-genai client
+talks to the local stub, so no network access or API key is needed.
+"""
+import asyncio
+import itertools
+import json
+import time
+
+import pytest
+
+from hedging import HedgePolicy, hedged_call
+from stub_gemini import StubGemini
+
+FAST_S = 0.05
+
+
+def _policy(**kwargs) -> HedgePolicy:
+    """A policy whose threshold is already warm at about ``FAST_S``."""
+    kwargs.setdefault("percentile", 90.0)
+    kwargs.setdefault("min_samples", 20)
+    kwargs.setdefault("max_hedge_rate", 1.0)
+    policy = HedgePolicy(**kwargs)
+    for _ in range(200):
+        policy.histogram.record(FAST_S)
+    return policy
+
+
+def _scripted(latencies, responses=None):
+    """Stub callbacks for the 1st, 2nd, ... request (the last entry repeats).
+
+    Requests are numbered on arrival, so responses follow request order
+    rather than completion order.
+    """
+    counter = itertools.count()
+
+    def pick(values, request):
+        return values[min(request["n"], len(values) - 1)]
+
+    def latency(request):
+        request["n"] = next(counter)
+        return pick(latencies, request)
+
+    kwargs = {"latency": latency}
+    if responses is not None:
+        kwargs["respond"] = lambda request: pick(responses, request)
+    return kwargs
+
+
+@pytest.fixture
+def stub_env(monkeypatch):
+    def start(**kwargs) -> StubGemini:
+        stub = StubGemini(**kwargs).__enter__()
+        monkeypatch.setenv("GOOGLE_GEMINI_BASE_URL", stub.url)
+        started.append(stub)
+        return stub
+
+    started: list = []
+    yield start
+    for stub in started:
+        stub.__exit__(None, None, None)
+
+
+def _evaluation(score: float) -> str:
+    from stub_gemini import sample_evaluation
+
+    return json.dumps(sample_evaluation(score))
+
+
+def _analyze(policy: HedgePolicy):
+    from analysis import analyze_pdf
+
+    return analyze_pdf("stub article text", api_key="stub", hedge=policy)
+
+
+def test_hedge_wins_on_outlier(stub_env):
+    stub = stub_env(**_scripted([5.0, FAST_S], [_evaluation(10.0), _evaluation(90.0)]))
+    policy = _policy()
+
+    started = time.monotonic()
+    evaluation = _analyze(policy)
+
+    assert time.monotonic() - started < 4.0
+    assert evaluation.overall_assessment.percentage_score == 90.0
+    assert len(stub.requests) == 2
+    assert policy.stats()["hedges"] == 1
+    assert policy.stats()["hedge_wins"] == 1
+
+
+def test_losing_attempt_is_cancelled(stub_env):
+    from google import genai
+
+    stub = stub_env(**_scripted([5.0, FAST_S]))
+    policy = _policy()
+    cancelled = []
+
+    async def run():
+        client = genai.Client(api_key="stub")
+        counter = itertools.count()
+
+        async def request():
+            attempt = next(counter)
+            try:
+                return await client.aio.models.generate_content(
+                    model="stub-model", contents="stub article text"
+                )
+            except asyncio.CancelledError:
+                cancelled.append(attempt)
+                raise
+
+        return await hedged_call(request, lambda response: json.loads(response.text), policy)
+
+    started = time.monotonic()
+    asyncio.run(run())
+
+    assert time.monotonic() - started < 4.0
+    assert cancelled == [0]
+    # The cancelled primary's elapsed time still reaches the histogram.
+    assert len(policy.histogram) == 202
+
+
+def test_invalid_first_response_falls_through(stub_env):
+    stub = stub_env(**_scripted([0.5, 1.0], ["not json", _evaluation(90.0)]))
+    policy = _policy()
+
+    evaluation = _analyze(policy)
+
+    assert evaluation.overall_assessment.percentage_score == 90.0
+    assert len(stub.requests) == 2
+    assert policy.stats()["hedge_wins"] == 1
+
+
+def test_max_extra_calls_caps_hedges(stub_env):
+    stub = stub_env(latency=lambda _request: 0.3)
+    policy = _policy(max_extra_calls=1)
+
+    for _ in range(3):
+        _analyze(policy)
+
+    assert policy.stats()["hedges"] == 1
+    assert len(stub.requests) == 4
+
+
+def test_max_hedge_rate_caps_overlapping_calls(stub_env):
+    from google import genai
+
+    stub = stub_env(latency=lambda _request: 0.5)
+    policy = _policy(max_hedge_rate=0.5)
+
+    async def run():
+        client = genai.Client(api_key="stub")
+
+        async def request():
+            return await client.aio.models.generate_content(
+                model="stub-model", contents="stub article text"
+            )
+
+        await asyncio.gather(*(
+            hedged_call(request, lambda response: json.loads(response.text), policy)
+            for _ in range(4)
+        ))
+
+    asyncio.run(run())
+
+    assert policy.stats()["hedges"] == 2
+    assert len(stub.requests) == 6
@@ -0,0 +1,227 @@
+"""Leases, checkpoints and retries in ``jobqueue.py`` against ``StubGemini``.
+
+Run with ``python -m pytest test_jobqueue.py``. Workers use the real
+google-genai client against the local stub, so no API key is needed.
+"""
+import json
+import time
+
+import pytest
+
+import jobqueue
+from jobqueue import (
+    DEAD,
+    DONE,
+    EXTRACTED,
+    GENERATED,
+    PROMPTED,
+    QUEUED,
+    READY,
+    STORED,
+    JobQueue,
+    LeaseLost,
+    process_job,
+    run_worker,
+)
+from stub_gemini import StubGemini, sample_evaluation
+
+LEASE_S = 0.3
+
+
+def _pdf(text: str) -> bytes:
+    """A minimal one-page PDF with *text* in its text layer."""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R"
+        b" /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, xref
+    )
+    return bytes(out)
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    def make(count: int) -> list:
+        paths = []
+        for i in range(count):
+            path = tmp_path / f"paper{i}.pdf"
+            path.write_bytes(_pdf(f"Randomised controlled trial number {i} of drug versus placebo"))
+            paths.append(path)
+        return paths
+
+    return make
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    servers = []
+
+    def start(**kwargs) -> StubGemini:
+        server = StubGemini(**kwargs).__enter__()
+        monkeypatch.setenv("GOOGLE_GEMINI_BASE_URL", server.url)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.__exit__(None, None, None)
+
+
+def _client():
+    from google import genai
+
+    return genai.Client(api_key="stub")
+
+
+def _row(queue: JobQueue, job_id: int) -> dict:
+    cursor = queue.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    return dict(zip([c[0] for c in cursor.description], cursor.fetchone()))
+
+
+def _to_prompted(queue: JobQueue, worker: str = "w1"):
+    job = queue.claim(worker)
+    job = queue.checkpoint(job, EXTRACTED, {"text": "article text"})
+    return queue.checkpoint(job, PROMPTED, {"prompt": "prompt"})
+
+
+class Crash(BaseException):
+    """Stands in for a worker process dying; not caught by ``run_worker``."""
+
+
+def test_resume_after_generated_makes_no_second_call(tmp_path, pdfs, stub, monkeypatch):
+    import reevaluation
+
+    server = stub()
+    db, archive = tmp_path / "q.db", tmp_path / "archive"
+    JobQueue(db).enqueue("c", pdfs(1))
+
+    def crash(*_args, **_kwargs):
+        raise Crash()
+
+    monkeypatch.setattr(reevaluation, "save_record", crash)
+    with pytest.raises(Crash):
+        run_worker(db, archive, "stub", lease_seconds=LEASE_S)
+    monkeypatch.undo()
+    monkeypatch.setenv("GOOGLE_GEMINI_BASE_URL", server.url)
+
+    queue = JobQueue(db)
+    assert _row(queue, 1)["stage"] not in (QUEUED, EXTRACTED, PROMPTED)
+    time.sleep(LEASE_S * 1.5)
+
+    assert run_worker(db, archive, "stub", lease_seconds=LEASE_S) == 1
+    assert len(server.requests) == 1
+    assert _row(queue, 1)["status"] == DONE
+    assert list(archive.glob("*.json"))
+
+
+def test_lease_lost_salvages_response(tmp_path, pdfs, stub):
+    server = stub()
+    first = JobQueue(tmp_path / "q.db", lease_seconds=LEASE_S)
+    second = JobQueue(tmp_path / "q.db", lease_seconds=LEASE_S)
+    first.enqueue("c", pdfs(1))
+    job = _to_prompted(first)
+    time.sleep(LEASE_S * 1.5)
+    taken = second.claim("w2")
+    assert taken.stage == PROMPTED
+
+    generated = {"response": json.dumps(sample_evaluation()), "model": "stub-model"}
+    with pytest.raises(LeaseLost):
+        first.checkpoint(job, GENERATED, generated)
+    assert first.salvage(job, GENERATED, generated)
+
+    process_job(second, taken, _client(), tmp_path / "archive")
+    assert server.requests == []
+    assert _row(second, taken.id)["stage"] == STORED
+
+
+def test_invalid_response_is_rewound(tmp_path, pdfs, stub):
+    server = stub()
+    queue = JobQueue(tmp_path / "q.db")
+    queue.enqueue("c", pdfs(1))
+    job = queue.checkpoint(_to_prompted(queue), GENERATED, {"response": "not json", "model": "m"})
+
+    with pytest.raises(ValueError):
+        process_job(queue, job, _client(), tmp_path / "archive")
+    assert _row(queue, job.id)["stage"] == PROMPTED
+    with pytest.raises(KeyError):
+        queue.artifact(job, "response")
+
+    process_job(queue, job._replace(stage=PROMPTED), _client(), tmp_path / "archive")
+    assert len(server.requests) == 1
+    assert _row(queue, job.id)["stage"] == STORED
+
+
+def test_throttled_failure_keeps_attempts(tmp_path, pdfs, stub):
+    server = stub(status=lambda _request: 429)
+    db = tmp_path / "q.db"
+    queue = JobQueue(db, max_attempts=1)
+    queue.enqueue("c", pdfs(1))
+
+    assert run_worker(db, tmp_path / "archive", "stub", lease_seconds=LEASE_S) == 0
+    row = _row(queue, 1)
+    assert len(server.requests) == 1
+    assert row["status"] == READY
+    assert row["attempts"] == 0
+    assert row["next_attempt_at"] >= time.time() + jobqueue.QUOTA_RETRY_S - 5
+
+    # The same failure without the quota classification uses up the attempt.
+    queue.db.execute("UPDATE jobs SET next_attempt_at = 0")
+    job = queue.claim("w")
+    assert queue.fail(job, "boom") is True
+    assert _row(queue, 1)["status"] == DEAD
+
+
+def test_dead_lettered_after_expired_leases(tmp_path, pdfs):
+    queue = JobQueue(tmp_path / "q.db", lease_seconds=0.05, max_attempts=2)
+    queue.enqueue("c", pdfs(1))
+
+    for attempt in (1, 2):
+        assert queue.claim("w").attempts == attempt
+        time.sleep(0.1)
+    assert queue.claim("w") is None
+
+    row = _row(queue, 1)
+    assert row["status"] == DEAD
+    assert row["last_error"] == "lease expired on attempt 2"
+    assert queue.requeue_dead() == 1
+    assert queue.claim("w").attempts == 1
+
+
+def test_stats_with_and_without_campaign(tmp_path, pdfs):
+    queue = JobQueue(tmp_path / "q.db")
+    first, second, third = pdfs(3)
+    assert queue.enqueue("a", [first, second]) == 2
+    assert queue.enqueue("b", [third]) == 1
+    assert queue.enqueue("a", [first]) == 0
+
+    job = queue.claim("w", campaign="a")
+    queue.checkpoint(job, STORED)
+    queue.claim("w", campaign="b")
+
+    overall = queue.stats()
+    assert overall["by_status"] == {DONE: 1, READY: 1, "leased": 1}
+    assert overall["backlog"] == 2
+    assert overall["done"] == 1
+    assert overall["backlog_by_stage"][QUEUED] == 2
+    assert overall["throughput_per_hour"] == 1.0
+    assert overall["eta_hours"] == 2.0
+
+    campaign = queue.stats("a")
+    assert campaign["by_status"] == {DONE: 1, READY: 1}
+    assert campaign["backlog"] == 1
+    assert campaign["backlog_by_stage"][QUEUED] == 1
+    assert campaign["eta_hours"] == 1.0
+    assert queue.stats("b")["done"] == 0
@@ -0,0 +1,77 @@
+"""Consistency checks in ``scoring.py``.
+
+Run with ``python -m pytest test_scoring.py``.
+"""
+from schema import CASPArticleEvaluation
+from scoring import consistency_issues, question_scores, rating_for_percentage
+from stub_gemini import sample_evaluation
+
+
+def _evaluation(**overall) -> dict:
+    data = sample_evaluation()
+    data["overall_assessment"].update(overall)
+    return data
+
+
+def _issues(data: dict) -> list:
+    return consistency_issues(CASPArticleEvaluation(**data))
+
+
+def _q11(data: dict) -> dict:
+    return data["casp_evaluation"]["section_c_applicability"]["question_11_benefits_worth_harms"]
+
+
+def test_rating_thresholds():
+    assert rating_for_percentage(80.0) == "HIGH"
+    assert rating_for_percentage(79.9) == "MODERATE_TO_HIGH"
+    assert rating_for_percentage(40.0) == "MODERATE"
+    assert rating_for_percentage(39.9) == "LOW"
+
+
+def test_consistent_evaluation_has_no_issues():
+    assert _issues(_evaluation()) == []
+
+
+def test_percentage_out_of_range():
+    issues = _issues(_evaluation(percentage_score=95.0, quality_rating="HIGH"))
+
+    assert len(issues) == 1
+    assert issues[0].startswith("percentage_score 95")
+
+
+def test_q11_not_applicable_is_excluded():
+    data = _evaluation(
+        total_applicable_questions=10,
+        total_score=8.0,
+        percentage_score=80.0,
+        quality_rating="HIGH",
+    )
+    _q11(data).update(answer="NOT_APPLICABLE", score=0.0)
+
+    assert len(question_scores(CASPArticleEvaluation(**data))) == 10
+    assert _issues(data) == []
+
+    _q11(data).update(answer="PARTIAL", score="N/A")
+    assert _issues(data) == []
+
+
+def test_q11_numeric_string_is_counted():
+    data = _evaluation()
+    _q11(data)["score"] = "0.5"
+
+    assert question_scores(CASPArticleEvaluation(**data))[-1] == 0.5
+    assert _issues(data) == []
+
+
+def test_rating_capped_by_cross_model_conflict():
+    # 72.7% implies MODERATE_TO_HIGH; a documented conflict may cap it lower.
+    capped = _evaluation(
+        quality_rating="MODERATE", cross_model_conflicts="High CASP but Low GRADE due to N=7"
+    )
+    assert _issues(capped) == []
+
+    undocumented = _evaluation(quality_rating="MODERATE")
+    assert [i for i in _issues(undocumented) if i.startswith("quality_rating")]
+
+    raised = _evaluation(quality_rating="HIGH", cross_model_conflicts="conflict")
+    assert [i for i in _issues(raised) if i.startswith("quality_rating")]
@@ -0,0 +1,393 @@
+"""Opt-in tracing and profiling for the analysis pipeline.
+
+Tracing is off unless enabled, and a disabled ``span`` costs about two
+microseconds. Enable it with environment variables before starting the app
+or a worker::
+
+    ANALYZER_TRACE=traces/spans.jsonl            # nested spans, OTLP JSON lines
+    ANALYZER_PROFILE=extract_pdf=sample,analyze_pdf.validate=cprofile
+    ANALYZER_SLOW_SECONDS=30                     # slow-PDF report threshold
+
+or call ``configure(...)`` directly.
+
+Each finished root span (one document) is appended to the trace file as one
+OTLP/JSON ``ExportTraceServiceRequest`` per line, the format the
+OpenTelemetry collector's file exporter writes and its ``otlpjsonfile``
+receiver reads. Stages listed in ``ANALYZER_PROFILE`` are wrapped in a
+profiler. With ``sample``, a background thread samples the stage's stack
+every few milliseconds and writes ``<trace>-<span>.collapsed`` in
+flamegraph.pl / speedscope format. With ``cprofile``, ``cProfile`` writes
+``<trace>-<span>.prof`` (view with snakeviz, or flameprof for a flamegraph).
+Any document whose root span exceeds the slow threshold also gets a
+``slow-<trace>.txt`` report: the span tree with total and self times and
+attributes.
+
+Spans opened in worker processes (e.g. ``extract_pdf``'s page pool) use
+``remote_span``; the worker returns the tree and the parent ``adopt``s it, so
+per-page stages appear in the document's trace either way.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SAMPLE_INTERVAL_S = 0.005
+SERVICE_NAME = "scientific-pdf-analyzer"
+
+
+class TraceConfig:
+    def __init__(
+        self,
+        path: Path,
+        profile: Optional[Dict[str, str]] = None,
+        slow_seconds: float = 30.0,
+    ):
+        self.path = Path(path)
+        self.profile = profile or {}
+        for mode in self.profile.values():
+            if mode not in ("sample", "cprofile"):
+                raise ValueError(f"unknown profiler {mode!r}; use 'sample' or 'cprofile'")
+        self.slow_seconds = slow_seconds
+        self.lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent", "start_ns", "end_ns",
+                 "attributes", "children", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.children: List[Span] = []
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    @property
+    def seconds(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+
+class _NoopSpan:
+    def set(self, key: str, value) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("analyzer_span", default=None)
+_config: Optional[TraceConfig] = None
+
+
+def configure(
+    path: Optional[Path],
+    profile: Optional[Dict[str, str]] = None,
+    slow_seconds: float = 30.0,
+) -> None:
+    """Enable tracing to *path*, or disable it when *path* is None."""
+    global _config
+    if path is None:
+        _config = None
+        return
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    _config = TraceConfig(path, profile, slow_seconds)
+
+
+def _configure_from_env() -> None:
+    path = os.environ.get("ANALYZER_TRACE")
+    if not path:
+        return
+    profile = {}
+    for item in filter(None, os.environ.get("ANALYZER_PROFILE", "").split(",")):
+        stage, _, mode = item.partition("=")
+        profile[stage.strip()] = mode.strip() or "sample"
+    configure(path, profile, float(os.environ.get("ANALYZER_SLOW_SECONDS", 30)))
+
+
+def enabled() -> bool:
+    return _config is not None
+
+
+def set_attribute(key: str, value) -> None:
+    """Attach an attribute to the current span, if tracing."""
+    current = _current.get()
+    if current is not None:
+        current.set(key, value)
+
+
+# ---------------------------------------------------------------------------
+# Spans
+# ---------------------------------------------------------------------------
+@contextmanager
+def span(name: str, **attributes):
+    """Time a stage as a span nested under the current one."""
+    config = _config
+    if config is None:
+        yield _NOOP
+        return
+
+    parent = _current.get()
+    current = Span(name, parent, attributes)
+    token = _current.set(current)
+    profiler = _start_profiler(config, current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        current.end_ns = time.time_ns()
+        _current.reset(token)
+        if parent is not None:
+            parent.children.append(current)
+        else:
+            _finish_trace(config, current)
+
+
+@contextmanager
+def remote_span(name: str, **attributes):
+    """Root span for work done in a worker process.
+
+    The finished span tree is not exported. Instead it is appended, as plain
+    picklable data, to the list this yields (which stays empty when tracing
+    is off). Return that list to the parent process and pass each entry to
+    ``adopt`` there.
+    """
+    shipped: list = []
+    if _config is None:
+        yield shipped
+        return
+
+    current = Span(name, None, attributes)
+    token = _current.set(current)
+    try:
+        yield shipped
+    except BaseException as exc:
+        current.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current.reset(token)
+        shipped.append(_to_data(current))
+
+
+def _to_data(node: Span) -> tuple:
+    children = [_to_data(child) for child in node.children]
+    return node.name, node.start_ns, node.end_ns, node.attributes, node.error, children
+
+
+def adopt(data: tuple) -> None:
+    """Attach a span tree from ``remote_span`` under the current span."""
+    parent = _current.get()
+    if _config is None or parent is None:
+        return
+    name, start_ns, end_ns, attributes, error, children = data
+    node = Span(name, parent, attributes)
+    node.start_ns, node.end_ns, node.error = start_ns, end_ns, error
+    token = _current.set(node)
+    try:
+        for child in children:
+            adopt(child)
+    finally:
+        _current.reset(token)
+    parent.children.append(node)
+
+
+def traced(name: str):
+    """Decorator form of ``span``."""
+
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+# ---------------------------------------------------------------------------
+# Profilers
+# ---------------------------------------------------------------------------
+def _artifact(config: TraceConfig, current: Span, suffix: str) -> Path:
+    return config.path.parent / f"{current.trace_id}-{current.name}{suffix}"
+
+
+class _CProfiler:
+    def __init__(self, config: TraceConfig, current: Span):
+        import cProfile
+
+        self.path = _artifact(config, current, ".prof")
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+        self.profile.dump_stats(self.path)
+
+
+class _Sampler(threading.Thread):
+    """Samples one thread's stack and writes collapsed stacks on ``stop``."""
+
+    def __init__(self, config: TraceConfig, current: Span):
+        super().__init__(name=f"sampler-{current.name}", daemon=True)
+        self.path = _artifact(config, current, ".collapsed")
+        self.target = threading.get_ident()
+        self.stacks: Counter = Counter()
+        self.done = threading.Event()
+        self.start()
+
+    def run(self) -> None:
+        while not self.done.wait(SAMPLE_INTERVAL_S):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self.done.set()
+        self.join()
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        self.path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def _start_profiler(config: TraceConfig, current: Span):
+    mode = config.profile.get(current.name)
+    if mode == "sample":
+        return _Sampler(config, current)
+    if mode == "cprofile":
+        try:
+            return _CProfiler(config, current)
+        except ValueError:  # another profiler is already active
+            _warn("cannot cProfile %s: another profiler is active", current.name)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+def _walk(root: Span):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.children))
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(node: Span) -> dict:
+    span_json = {
+        "traceId": node.trace_id,
+        "spanId": node.span_id,
+        "name": node.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(node.start_ns),
+        "endTimeUnixNano": str(node.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in node.attributes.items()],
+        "status": {"code": 2, "message": node.error} if node.error else {"code": 1},
+    }
+    if node.parent is not None:
+        span_json["parentSpanId"] = node.parent.span_id
+    return span_json
+
+
+def _self_seconds(node: Span) -> float:
+    # Children can overlap (pooled pages, concurrent hedged calls), so
+    # subtract the union of their intervals, not the sum of their durations.
+    covered, end = 0, node.start_ns
+    for child in sorted(node.children, key=lambda c: c.start_ns):
+        start, stop = max(child.start_ns, end), min(child.end_ns, node.end_ns)
+        if stop > start:
+            covered += stop - start
+            end = stop
+    return max(0.0, node.seconds - covered / 1e9)
+
+
+def _slow_report(root: Span) -> str:
+    lines = [f"Slow document: {root.seconds:.2f} s (trace {root.trace_id})", ""]
+
+    by_stage: Dict[str, List[float]] = {}
+    for node in _walk(root):
+        totals = by_stage.setdefault(node.name, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += node.seconds
+        totals[2] += _self_seconds(node)
+    lines.append("Stages by self time:")
+    for name, (count, total, own) in sorted(by_stage.items(), key=lambda kv: -kv[1][2]):
+        lines.append(
+            f"  {name:<38} {count:5d}x  total {total * 1000:10.1f} ms  self {own * 1000:10.1f} ms"
+        )
+    lines += ["", "Span tree:"]
+
+    def render(node: Span, depth: int) -> None:
+        attrs = " ".join(f"{k}={v}" for k, v in node.attributes.items())
+        lines.append(
+            f"  {'  ' * depth}{node.name:<{40 - 2 * depth}} {node.seconds * 1000:10.1f} ms"
+            f"  self {_self_seconds(node) * 1000:10.1f} ms  {attrs}".rstrip()
+        )
+        for child in node.children:
+            render(child, depth + 1)
+
+    render(root, 0)
+    return "\n".join(lines) + "\n"
+
+
+def _warn(message: str, *args) -> None:
+    import logging
+
+    logging.getLogger(__name__).warning(message, *args)
+
+
+def _finish_trace(config: TraceConfig, root: Span) -> None:
+    import json
+
+    request = {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [_otlp_span(node) for node in _walk(root)],
+            }],
+        }]
+    }
+    line = json.dumps(request, separators=(",", ":"))
+    with config.lock:
+        with open(config.path, "a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+
+    if root.seconds >= config.slow_seconds:
+        report = config.path.parent / f"slow-{root.trace_id}.txt"
+        report.write_text(_slow_report(root), encoding="utf-8")
+        _warn("slow document (%.1f s); report written to %s", root.seconds, report)
+
+
+_configure_from_env()
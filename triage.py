@@ -0,0 +1,244 @@
+"""Fast triage of scanned and image-only PDFs.
+
+``extract_pdf`` runs pdfminer's full page interpretation on every page, which
+is wasted on pages that have no text layer. ``triage_pdf`` instead opens the
+document with pdfium (already installed as a pdfplumber dependency), counts
+the characters in each page's text layer and the page area covered by image
+objects, and classifies the document in milliseconds:
+
+* ``TEXT``: every page with images also has a text layer,
+* ``PARTIAL``: some pages are image-only (e.g. scanned appendices),
+* ``IMAGE_ONLY``: no page has a real text layer.
+
+``extract_document`` routes accordingly: every page with any text layer goes
+through ``extract_pdf`` and image-only pages through an optional local OCR stage
+(the ``tesseract`` binary, if installed), run across a process pool with a
+per-page on-disk cache.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from extraction import PDFExtraction, _read_source, extract_pdf
+from tracing import traced
+
+# A document whose pages all have fewer text-layer characters than this is
+# image-only (page numbers and running headers survive on many scans). Used
+# for the document kind only: any page with a text layer is still extracted.
+MIN_TEXT_CHARS = 40
+
+# Share of the page area covered by images above which a page without a
+# text layer is treated as a scan rather than as a blank page.
+MIN_IMAGE_COVERAGE = 0.3
+
+OCR_DPI = 300
+OCR_LANG = "eng"
+OCR_CACHE_DIR = Path.home() / ".cache" / "scientific-pdf-analyzer" / "ocr"
+
+
+class DocumentKind(str, Enum):
+    TEXT = "TEXT"
+    PARTIAL = "PARTIAL"
+    IMAGE_ONLY = "IMAGE_ONLY"
+
+
+class PageTriage(NamedTuple):
+    number: int  # 1-based
+    chars: int
+    image_coverage: float
+
+    @property
+    def has_text(self) -> bool:
+        return self.chars >= MIN_TEXT_CHARS
+
+    @property
+    def is_image(self) -> bool:
+        return self.image_coverage >= MIN_IMAGE_COVERAGE
+
+    @property
+    def is_scan(self) -> bool:
+        return self.chars == 0 and self.is_image
+
+
+class Triage(NamedTuple):
+    kind: DocumentKind
+    pages: List[PageTriage]
+
+    @property
+    def text_pages(self) -> List[int]:
+        return [page.number for page in self.pages if page.chars]
+
+    @property
+    def image_pages(self) -> List[int]:
+        if self.kind is DocumentKind.IMAGE_ONLY:
+            # A scan's stray header characters do not make it a text page.
+            return [page.number for page in self.pages if page.is_image]
+        return [page.number for page in self.pages if page.is_scan]
+
+
+# ---------------------------------------------------------------------------
+# Triage
+# ---------------------------------------------------------------------------
+def _image_coverage(page, pdfium_c) -> float:
+    width, height = page.get_size()
+    covered = 0.0
+    for obj in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE,), max_depth=2):
+        left, bottom, right, top = obj.get_bounds()
+        left, right = max(left, 0.0), min(right, width)
+        bottom, top = max(bottom, 0.0), min(top, height)
+        if right > left and top > bottom:
+            covered += (right - left) * (top - bottom)
+    return min(covered / (width * height), 1.0) if width and height else 0.0
+
+
+@traced("triage_pdf")
+def triage_pdf(uploaded_file) -> Triage:
+    """Classify a PDF from its text layer and image coverage, without layout."""
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+
+    pdf = pdfium.PdfDocument(_read_source(uploaded_file))
+    try:
+        pages = []
+        for index in range(len(pdf)):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            pages.append(
+                PageTriage(index + 1, textpage.count_chars(), _image_coverage(page, pdfium_c))
+            )
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+
+    with_text = sum(page.has_text for page in pages)
+    scans = sum(page.is_scan for page in pages)
+    if not with_text:
+        kind = DocumentKind.IMAGE_ONLY
+    elif scans:
+        kind = DocumentKind.PARTIAL
+    else:
+        kind = DocumentKind.TEXT
+    return Triage(kind, pages)
+
+
+# ---------------------------------------------------------------------------
+# OCR
+# ---------------------------------------------------------------------------
+def ocr_available() -> bool:
+    return shutil.which("tesseract") is not None
+
+
+def _ocr_page(source, number: int, cache_path: Path, dpi: int, lang: str) -> str:
+    """Render one page and OCR it with tesseract; runs in worker processes."""
+    if cache_path.exists():
+        return cache_path.read_text(encoding="utf-8")
+
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(source)
+    try:
+        image = pdf[number - 1].render(scale=dpi / 72).to_pil()
+    finally:
+        pdf.close()
+    with tempfile.TemporaryDirectory() as tmp:
+        png = Path(tmp) / "page.png"
+        image.save(png)
+        text = subprocess.run(
+            ["tesseract", str(png), "stdout", "-l", lang, "--dpi", str(dpi)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, cache_path)
+    return text
+
+
+@traced("ocr")
+def ocr_pages(
+    uploaded_file,
+    pages: Sequence[int],
+    workers: Optional[int] = None,
+    cache_dir: Path = OCR_CACHE_DIR,
+    dpi: int = OCR_DPI,
+    lang: str = OCR_LANG,
+) -> Dict[int, str]:
+    """OCR the given 1-based *pages* in parallel; return ``{page: text}``.
+
+    Results are cached per page under *cache_dir*, keyed by a hash of the
+    PDF bytes, the DPI and the language.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if not ocr_available():
+        raise RuntimeError("OCR requires the tesseract binary on PATH")
+    source = _read_source(uploaded_file)
+    data = source if isinstance(source, bytes) else Path(source).read_bytes()
+    key = hashlib.sha256(data).hexdigest()
+    cache = Path(cache_dir) / key / f"{dpi}-{lang}"
+
+    todo = [n for n in pages if not (cache / f"{n}.txt").exists()]
+    if todo:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(todo)))
+        with tempfile.TemporaryDirectory() as tmp:
+            # Hand workers a path, not one pickled copy of the PDF per page.
+            if isinstance(source, bytes):
+                path = Path(tmp) / "source.pdf"
+                path.write_bytes(source)
+                source = str(path)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(
+                    _ocr_page,
+                    [source] * len(todo),
+                    todo,
+                    [cache / f"{n}.txt" for n in todo],
+                    [dpi] * len(todo),
+                    [lang] * len(todo),
+                ))
+    return {n: (cache / f"{n}.txt").read_text(encoding="utf-8") for n in pages}
+
+
+# ---------------------------------------------------------------------------
+# Routing
+# ---------------------------------------------------------------------------
+def extract_document(
+    uploaded_file,
+    ocr: bool = True,
+    workers: Optional[int] = None,
+    triaged: Optional[Triage] = None,
+) -> PDFExtraction:
+    """Triage the PDF, then extract text pages and (optionally) OCR scanned ones.
+
+    Pass *triaged* to reuse an earlier ``triage_pdf`` result. OCR output is
+    appended after the text-layer pages as ``[OCR pN]`` blocks. Scanned pages
+    are dropped when *ocr* is false or tesseract is missing.
+    """
+    triage = triaged or triage_pdf(uploaded_file)
+    n_pages = len(triage.pages)
+
+    if triage.kind is DocumentKind.TEXT:
+        return extract_pdf(uploaded_file, workers=workers)
+    text_pages = triage.text_pages
+    if triage.kind is DocumentKind.IMAGE_ONLY and ocr and ocr_available():
+        # Scans with stray header characters are OCR'd; do not send them twice.
+        scans = set(triage.image_pages)
+        text_pages = [n for n in text_pages if n not in scans]
+    if text_pages:
+        result = extract_pdf(uploaded_file, workers=workers, pages=text_pages)
+    else:
+        result = PDFExtraction(text="", pages=n_pages, tables=0, token_delta=0)
+
+    if not (ocr and ocr_available() and triage.image_pages):
+        return result
+    ocr_text = ocr_pages(uploaded_file, triage.image_pages, workers=workers)
+    blocks = [f"[OCR p{n}]\n{text.strip()}" for n, text in ocr_text.items() if text.strip()]
+    return result._replace(text="\n\n".join(part for part in [result.text, *blocks] if part))